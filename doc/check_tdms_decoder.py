@@ -0,0 +1,61 @@
+"""
+Check the TDMS decoder of TDMSData against pytdms
+
+Writes a synthetic multi record file with write_signal_to_tdms, reads it with
+pytdms.read and with TDMSData.read_samples at an offset which is not aligned
+to the records, and compares the samples. Needs pytdms, which iqtools itself
+does not depend on. It uses the iqtools of this checkout:
+
+    pip install pytdms
+    python doc/check_tdms_decoder.py
+
+"""
+
+import os
+import sys
+import tempfile
+import numpy as np
+import pytdms
+
+# use the iqtools of this checkout, also when it is not installed
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from iqtools import TDMSData, write_signal_to_tdms  # noqa: E402
+
+NSAMPLES_PER_RECORD = 1000
+NRECORDS = 7
+
+
+def main():
+    rng = np.random.default_rng(0)
+    x = rng.standard_normal(NSAMPLES_PER_RECORD * NRECORDS) + \
+        1j * rng.standard_normal(NSAMPLES_PER_RECORD * NRECORDS)
+    # different levels per record, so that every record gets its own gain
+    x *= np.repeat(np.arange(1, NRECORDS + 1), NSAMPLES_PER_RECORD)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, 'check')
+        write_signal_to_tdms(x, filename, fs=1e6, center=1e8,
+                             nsamples_per_record=NSAMPLES_PER_RECORD)
+        filename += '.tdms'
+
+        _, raw = pytdms.read(filename)
+        gains = np.repeat(np.array(raw[b"/'RecordHeader'/'gain'"]), NSAMPLES_PER_RECORD)
+        reference = (np.array(raw[b"/'RecordData'/'I'"]) +
+                     1j * np.array(raw[b"/'RecordData'/'Q'"])) * gains
+
+        iq_data = TDMSData(filename)
+        offset = NSAMPLES_PER_RECORD // 3
+        nsamples = len(reference) - offset - NSAMPLES_PER_RECORD // 2
+        iq_data.precision = 'complex128'
+        iq_data.read_samples(nsamples, offset)
+
+    assert iq_data.fs == 1e6 and iq_data.center == 1e8
+    assert np.array_equal(iq_data.data_array, reference[offset:offset + nsamples])
+    # the decoded file stays within the 16 bit quantisation of the written signal
+    assert np.allclose(iq_data.data_array, x[offset:offset + nsamples],
+                       rtol=0, atol=gains.max())
+    print('TDMSData matches pytdms for {} samples at offset {}.'.format(nsamples, offset))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,15 +1,58 @@
-from iqtools.tiqdata import TIQData
-from iqtools.iqbase import IQBase
-from iqtools.tcapdata import TCAPData
-from iqtools.tdmsdata import TDMSData
-from iqtools.bindata import BINData
-from iqtools.iqtdata import IQTData
-from iqtools.tiqdata import TIQData
-from iqtools.csvdata import CSVData
-from iqtools.wavdata import WAVData
-from iqtools.grdata import GRData
-from iqtools.lcdata import LCData
-from iqtools.xdatdata import XDATData
-#from iqtools.version import __version__
-from iqtools.plotters import *
-from iqtools.tools import *
+"""
+The readers, writers and plotters are imported lazily, i.e. only when they are
+used for the first time. This keeps `import iqtools` fast, and heavy or optional
+dependencies like matplotlib, scipy.signal or uproot3 are only loaded when needed.
+"""
+
+import importlib
+
+_LAZY_MODULES = {
+    'iqtools.iqbase': ['IQBase', 'set_default_precision', 'get_cache_info'],
+    'iqtools.tiqdata': ['TIQData'],
+    'iqtools.tcapdata': ['TCAPData', 'TCAPMultiData'],
+    'iqtools.tdmsdata': ['TDMSData'],
+    'iqtools.bindata': ['BINData'],
+    'iqtools.iqtdata': ['IQTData'],
+    'iqtools.csvdata': ['CSVData'],
+    'iqtools.wavdata': ['WAVData'],
+    'iqtools.grdata': ['GRData'],
+    'iqtools.lcdata': ['LCData'],
+    'iqtools.xdatdata': ['XDATData'],
+    'iqtools.iqcdata': ['IQCData'],
+    'iqtools.prefetch': ['PrefetchReader'],
+    'iqtools.accumulators': ['SpectrumAccumulator', 'SpectrogramAccumulator', 'BandPowerAccumulator'],
+    'iqtools.registry': ['register_format', 'detect_format'],
+    'iqtools.tools': ['get_iq_object', 'get_eng_notation', 'get_cplx_spectrogram', 'get_inv_cplx_spectrogram',
+                      'get_root_th2d', 'make_test_signal', 'shift_phase', 'write_signal_to_bin',
+                      'write_signal_to_tdms', 'write_signal_to_csv', 'write_signal_to_wav', 'make_analytical',
+                      'read_result_csv', 'read_specan_xml', 'read_data_csv', 'parse_filename',
+                      'write_timedata_to_npy', 'write_timedata_to_iqc', 'write_timedata_to_root', 'write_spectrum_to_csv',
+                      'write_spectrum_to_root'],
+    'iqtools.plotters': ['plot_hilbert', 'plot_frame_power', 'plot_spectrogram', 'plot_spectrum',
+                         'plot_spectrogram_with_gnuplot', 'plot_phase_shift'],
+}
+
+_LAZY_NAMES = {name: module for module,
+               names in _LAZY_MODULES.items() for name in names}
+
+__all__ = list(_LAZY_NAMES)
+
+
+def __getattr__(name):
+    if name in _LAZY_NAMES:
+        value = getattr(importlib.import_module(_LAZY_NAMES[name]), name)
+        globals()[name] = value
+        return value
+    # submodules like iqtools.tools or iqtools.plotters, which the former star imports bound as well
+    if not name.startswith('_'):
+        try:
+            return importlib.import_module('iqtools.' + name)
+        except ModuleNotFoundError as e:
+            if e.name != 'iqtools.' + name:
+                raise
+    raise AttributeError(
+        "module 'iqtools' has no attribute '{}'".format(name))
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -50,6 +50,8 @@ def main():
         "-y", "--npy", help="Write dic to NPY file.", action="store_true")
     parser.add_argument(
         "-r", "--raw", help="Write file to a raw format.", action="store_true")
+    parser.add_argument(
+        "-c", "--convert", help="Convert the whole file to the IQC cache format.", action="store_true")
 
     args = parser.parse_args()
 
@@ -66,6 +68,10 @@ def main():
         print('Datafile needs an additional header file which was not specified. Nothing to do. Aborting...')
         sys.exit()
 
+    if args.convert:
+        log.info('Converting whole file to IQC.')
+        print('Written {}.'.format(write_timedata_to_iqc(iq_data)))
+
     iq_data.read(args.nframes, args.lframes, args.sframes)
 
     # Other command line arguments
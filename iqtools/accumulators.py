@@ -0,0 +1,338 @@
+"""
+Streaming accumulators for spectra
+
+Accumulate spectra of a whole file chunk by chunk in fixed memory, e.g. for
+long term averaged Schottky spectra over hours of data. Partial results can be
+saved, loaded and merged, so that parts of a file or several files can be
+processed on several cores and combined at the end.
+"""
+
+import numpy as np
+from iqtools.iqbase import IQBase, get_cached_array
+
+TERMINATION = 50  # in Ohms for termination resistor, as in IQBase.get_fft
+
+
+class SpectrumAccumulator(object):
+    """
+    Accumulates the FFT of frames of length lframes in four ways at once:
+
+    * incoherent: average of the power of each frame
+    * coherent: complex sum of the FFT bins of all frames, scaled like IQBase.get_fft
+    * max: maximum power of each bin over all frames (max hold)
+    * min: minimum power of each bin over all frames (min hold)
+
+    Usage:
+
+        acc = SpectrumAccumulator(1024, iq_data.fs, window=iq_data.get_window(1024))
+        acc.accumulate(iq_data, start=0, stop=iq_data.nsamples_total // 2)
+        acc.save('first_half.npz')
+        ...
+        acc = SpectrumAccumulator.load('first_half.npz')
+        acc.merge(SpectrumAccumulator.load('second_half.npz'))
+        f, p = acc.get_spectrum('incoherent')
+
+    The power is calculated like in IQBase.get_fft, i.e. the RMS voltage of each bin on a 50 Ohm termination.
+    """
+
+    MODES = ['incoherent', 'coherent', 'max', 'min']
+
+    def __init__(self, lframes, fs, window=None):
+        self.lframes = int(lframes)
+        self.fs = float(fs)
+        if window is None:
+            window = np.ones(self.lframes)
+        if len(window) != self.lframes:
+            raise ValueError(
+                'Window length {} does not match the frame length {}.'.format(len(window), self.lframes))
+        self.window = np.asarray(window)
+        self.reset()
+
+    def reset(self):
+        self.nframes = 0
+        # sums in double precision, so that hours of data do not lose precision
+        self.power_sum = np.zeros(self.lframes)
+        self.complex_sum = np.zeros(self.lframes, dtype=np.complex128)
+        self.max_hold = np.full(self.lframes, -np.inf)
+        self.min_hold = np.full(self.lframes, np.inf)
+
+    def add_frames(self, frames):
+        """
+        Add the spectra of a 2D array with one frame in each row.
+        """
+        import scipy.fft
+        frames = np.atleast_2d(frames)
+        if frames.shape[1] != self.lframes:
+            raise ValueError(
+                'Frame length {} does not match the frame length {}.'.format(frames.shape[1], self.lframes))
+        if not len(frames):
+            return
+        v_peak_iq = scipy.fft.fft(frames * self.window, axis=1, workers=-1)
+        self.complex_sum += v_peak_iq.sum(axis=0)
+        p = self.get_power(v_peak_iq)
+        self.power_sum += p.sum(axis=0)
+        np.maximum(self.max_hold, p.max(axis=0), out=self.max_hold)
+        np.minimum(self.min_hold, p.min(axis=0), out=self.min_hold)
+        self.nframes += len(frames)
+
+    def accumulate(self, iq_data, nframes_per_chunk=100, start=0, stop=None):
+        """
+        Stream the samples between start and stop of an IQBase object chunk by chunk into the accumulator.
+        """
+        for frames in iq_data.iter_chunks(self.lframes, nframes_per_chunk, start=start, stop=stop):
+            self.add_frames(frames)
+        return self
+
+    def get_power(self, v_peak_iq):
+        v_rms = abs(v_peak_iq) / self.lframes / 2 ** 0.5
+        return v_rms ** 2 / TERMINATION
+
+    def get_spectrum(self, mode='incoherent'):
+        """
+        Accumulated spectrum, fft shifted.
+
+        :param mode: 'incoherent', 'coherent', 'max' or 'min'
+        :return: frequency and power, the complex voltage of the coherent mode is given by get_coherent_voltage
+        """
+        assert mode in self.MODES
+        freqs = self.get_freqs()
+
+        if mode == 'coherent':
+            p = self.get_power(self.complex_sum)
+        elif mode == 'incoherent':
+            p = self.power_sum / self.nframes
+        elif mode == 'max':
+            p = self.max_hold
+        else:
+            p = self.min_hold
+        return freqs, np.fft.fftshift(p)
+
+    def get_coherent_voltage(self):
+        """
+        Complex voltage of the coherent mode like the third result of IQBase.get_fft, fft shifted.
+
+        :return: frequency and complex voltage
+        """
+        freqs = self.get_freqs()
+        # like get_fft, the complex bins are summed, i.e. averaged and multiplied by the number of frames
+        return freqs, np.fft.fftshift(self.complex_sum / self.lframes)
+
+    def get_freqs(self):
+        if not self.nframes:
+            raise ValueError('No frames have been accumulated yet.')
+        return get_cached_array('fftfreq', self.lframes, 'float64', (self.fs,))
+
+    def merge(self, other):
+        """
+        Add the results of another accumulator with the same parameters, e.g. from another part of the file.
+        """
+        if other.lframes != self.lframes or other.fs != self.fs or not np.array_equal(other.window, self.window):
+            raise ValueError('Only accumulators with the same frame length, sampling frequency and window can be merged.')
+        self.nframes += other.nframes
+        self.power_sum += other.power_sum
+        self.complex_sum += other.complex_sum
+        np.maximum(self.max_hold, other.max_hold, out=self.max_hold)
+        np.minimum(self.min_hold, other.min_hold, out=self.min_hold)
+        return self
+
+    def save(self, filename):
+        """
+        Save the state as a numpy npz file, e.g. as a checkpoint.
+        """
+        np.savez(filename, lframes=self.lframes, fs=self.fs, window=self.window, nframes=self.nframes,
+                 power_sum=self.power_sum, complex_sum=self.complex_sum,
+                 max_hold=self.max_hold, min_hold=self.min_hold)
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Create an accumulator from a file written by save.
+        """
+        with np.load(filename) as dic:
+            acc = cls(int(dic['lframes']), float(dic['fs']), dic['window'])
+            acc.nframes = int(dic['nframes'])
+            acc.power_sum = dic['power_sum']
+            acc.complex_sum = dic['complex_sum']
+            acc.max_hold = dic['max_hold']
+            acc.min_hold = dic['min_hold']
+        return acc
+
+
+class SpectrogramAccumulator(object):
+    """
+    Averages a spectrogram in time while its frames are being calculated, like IQBase.get_averaged_spectrogram
+    but without keeping the whole spectrogram in memory. Only the running sum of one partial group is kept.
+
+    Usage:
+
+        acc = SpectrogramAccumulator(every=10)
+        f, t, zz = acc.accumulate(iq_data, lframes=1024)
+
+    or with spectra calculated elsewhere:
+
+        for z, t in ...:
+            t_avg, z_avg = acc.add_frames(z, t)
+        t_avg, z_avg = acc.finish()
+
+    Each averaged row gets the time of the last frame of its group, as in get_averaged_spectrogram.
+    Frames remaining at the end which do not fill a group are dropped by default as in
+    get_averaged_spectrogram, with tail='average' they are averaged into one more row.
+    """
+
+    TAILS = ['drop', 'average']
+
+    def __init__(self, every, tail='drop'):
+        if every < 1:
+            raise ValueError('At least one frame per group is needed.')
+        assert tail in self.TAILS
+        self.every = int(every)
+        self.tail = tail
+        self.reset()
+
+    def reset(self):
+        self.group_sum = None
+        self.group_count = 0
+        self.group_time = 0.0
+
+    def add_frames(self, zz, t):
+        """
+        Add spectra with one frame in each row.
+
+        :param zz: 2D array of spectra
+        :param t: times of the rows
+        :return: times and averaged rows of the groups completed by these frames, possibly empty
+        """
+        zz = np.atleast_2d(zz)
+        t = np.atleast_1d(t)
+        if len(t) != len(zz):
+            raise ValueError('Number of times {} does not match the number of frames {}.'.format(len(t), len(zz)))
+        if self.group_sum is None:
+            self.group_sum = np.zeros(zz.shape[1])
+        t_out = []
+        z_out = []
+
+        # first complete the partial group of the previous call
+        i = min(self.every - self.group_count, len(zz)) if self.group_count else 0
+        if i:
+            self.add_to_group(zz[:i], t[:i])
+            if self.group_count == self.every:
+                t_out.append([self.group_time])
+                z_out.append(self.pop_group()[np.newaxis])
+
+        # then all complete groups at once
+        n_groups = (len(zz) - i) // self.every
+        j = i + n_groups * self.every
+        if n_groups:
+            z_out.append(np.reshape(zz[i:j], (n_groups, self.every, -1)).mean(axis=1))
+            t_out.append(t[i + self.every - 1:j:self.every])
+
+        # the rest starts a new partial group
+        if j < len(zz):
+            self.add_to_group(zz[j:], t[j:])
+
+        if not z_out:
+            return np.zeros(0), np.zeros((0, zz.shape[1]))
+        return np.concatenate(t_out), np.concatenate(z_out)
+
+    def add_to_group(self, zz, t):
+        self.group_sum += zz.sum(axis=0)
+        self.group_count += len(zz)
+        self.group_time = t[-1]
+
+    def pop_group(self):
+        row = self.group_sum / self.group_count
+        self.group_sum = np.zeros_like(self.group_sum)
+        self.group_count = 0
+        return row
+
+    def finish(self):
+        """
+        Handle the remaining frames according to the tail policy and start over.
+
+        :return: times and averaged rows, one row if the remaining frames are averaged, otherwise empty
+        """
+        ncols = 0 if self.group_sum is None else len(self.group_sum)
+        if self.tail == 'average' and self.group_count:
+            t_out = np.array([self.group_time])
+            z_out = self.pop_group()[np.newaxis]
+        else:
+            t_out, z_out = np.zeros(0), np.zeros((0, ncols))
+        self.reset()
+        return t_out, z_out
+
+    def accumulate(self, iq_data, lframes, nframes_per_chunk=100, hop=None, start=0, stop=None):
+        """
+        Stream the samples between start and stop of an IQBase object chunk by chunk, calculate the spectra
+        with its get_spectrogram_frames and average them.
+
+        :return: frequency and time as 1D arrays and the averaged spectrogram
+        """
+        if not hop:
+            hop = lframes
+        t_out = []
+        z_out = []
+        nframes_done = 0
+        real = False
+        for frames in iq_data.iter_chunks(lframes, nframes_per_chunk, hop=hop, start=start, stop=stop):
+            real = np.isrealobj(frames)
+            t = (np.arange(nframes_done, nframes_done + len(frames)) * hop + start) / iq_data.fs
+            nframes_done += len(frames)
+            t_avg, z_avg = self.add_frames(iq_data.get_spectrogram_frames(frames), t)
+            t_out.append(t_avg)
+            z_out.append(z_avg)
+        t_avg, z_avg = self.finish()
+        t_out.append(t_avg)
+        z_out.append(z_avg)
+        freqs = iq_data.get_spectrogram_freqs(lframes, real)
+        return freqs, np.concatenate(t_out), np.concatenate([z.reshape(-1, len(freqs)) for z in z_out])
+
+
+class BandPowerAccumulator(object):
+    """
+    Channel power of several frequency bands vs time as a streaming stage, e.g. for monitoring several
+    revolution harmonics at once. The bin ranges of the bands are calculated once, the power of all bands in
+    a chunk of frames is then calculated from cumulative sums like IQBase.get_channel_power_vs_time.
+
+    Usage:
+
+        acc = BandPowerAccumulator(iq_data.get_spectrogram_freqs(1024), [(-5e3, -3e3), (3e3, 5e3)],
+                                   nbw=iq_data.get_nbw())
+        t, p = acc.accumulate(iq_data, lframes=1024)
+
+    or with spectra calculated elsewhere:
+
+        p = acc.add_frames(zz)
+    """
+
+    def __init__(self, f, bands, nbw=1.0):
+        self.f = np.asarray(f)
+        self.bands = np.reshape(bands, (-1, 2))
+        self.nbw = nbw
+        self.begin, self.end = IQBase.get_band_indexes(self.f, self.bands)
+
+    def add_frames(self, zz):
+        """
+        Power of each band for spectra with one frame in each row.
+
+        :return: 2D array with one row per frame and one column per band
+        """
+        zz = np.atleast_2d(zz)
+        if zz.shape[1] != len(self.f):
+            raise ValueError(
+                'Spectrum length {} does not match the frequency axis length {}.'.format(zz.shape[1], len(self.f)))
+        return IQBase.get_band_sum(zz, self.begin, self.end) / self.nbw
+
+    def accumulate(self, iq_data, lframes, nframes_per_chunk=100, hop=None, start=0, stop=None):
+        """
+        Stream the samples between start and stop of an IQBase object chunk by chunk, calculate the spectra
+        with its get_spectrogram_frames and the power in each band.
+
+        :return: time and power with one row per frame and one column per band
+        """
+        if not hop:
+            hop = lframes
+        p_out = [np.zeros((0, len(self.bands)))]
+        for frames in iq_data.iter_chunks(lframes, nframes_per_chunk, hop=hop, start=start, stop=stop):
+            p_out.append(self.add_frames(iq_data.get_spectrogram_frames(frames)))
+        p = np.concatenate(p_out)
+        return (np.arange(len(p)) * hop + start) / iq_data.fs, p
@@ -19,26 +19,30 @@ class BINData(IQBase):
         # Additional fields in this subclass
         self.date_time = time.ctime(os.path.getctime(self.filename))
         self.center = 0.0
-        # each complex64 sample is 8 bytes on disk
-        self.nsamples_total = os.path.getsize(filename) / 8
+        # each complex64 sample is 8 bytes on disk, the first one is the header
+        self.nsamples_total = os.path.getsize(filename) // 8 - 1
+        self.read_header()
 
     def read(self, nframes=10, lframes=1024, sframes=0):
         self.read_samples(nframes * lframes, offset=sframes * lframes)
 
-    def read_samples(self, nsamples, offset=0):
+    def read_header(self):
         """
-        Read from binary file. needs the first value to be the header
-        please check the function:
+        The first complex value holds the sampling and the center frequency, please check the function:
             write_signal_to_bin
         in the tools.
         """
+        x = np.fromfile(self.filename, dtype=np.complex64, count=1)
+        self.fs = float(np.real(x[0]))
+        self.center = float(np.imag(x[0]))
+
+    def read_samples(self, nsamples, offset=0):
+        """
+        Read from binary file. Only the requested samples are read, right after the header value.
+        """
         if nsamples > self.nsamples_total - offset:
             raise ValueError(
                 'Requested number of samples is larger than the available {} samples.'.format(self.nsamples_total))
 
-        x = np.fromfile(self.filename, dtype=np.complex64)
-        self.fs = float(np.real(x[0]))
-        self.center = float(np.imag(x[0]))
-        all_data = x[1:]
-
-        self.data_array = all_data[offset:nsamples + offset]
+        self.data_array = np.fromfile(
+            self.filename, dtype=np.complex64, count=nsamples, offset=(offset + 1) * 8).astype(self.dtype, copy=False)
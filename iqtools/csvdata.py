@@ -9,30 +9,126 @@ Xaratustrah Aug-2015
 import numpy as np
 import time
 import os
+import logging as log
 from iqtools.iqbase import IQBase
 
 
 class CSVData(IQBase):
-    def __init__(self, filename):
+    def __init__(self, filename, index_every=4096):
         super().__init__(filename)
 
         # Additional fields in this subclass
         self.center = 0.0
         self.date_time = time.ctime(os.path.getctime(self.filename))
-        self.nsamples_total = sum(1 for line in open(filename)) - 1
+
+        # byte offset of every index_every-th sample line
+        self.index_every = index_every
+        self.line_offsets = None
+        self.build_line_index()
+        self.read_header()
 
     def read(self, nframes=10, lframes=1024, sframes=0):
         self.read_samples(nframes * lframes, offset=sframes * lframes)
 
+    def read_header(self):
+        """
+        The first line holds the sampling frequency and the center frequency, looking like a complex number.
+        """
+        with open(self.filename, 'rb') as f:
+            line = f.readline()
+        self.fs, self.center = [float(v) for v in line.split(b'|')[:2]]
+
+    def build_line_index(self, chunk_size=2 ** 24):
+        """
+        Scan the file once in binary chunks and note the byte offset where every index_every-th
+        sample line begins. The first line is the header and does not count as a sample.
+        """
+        offsets = []
+        n_newlines = 0
+        last_byte = b'\n'
+        with open(self.filename, 'rb') as f:
+            base = 0
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                newlines = np.flatnonzero(np.frombuffer(
+                    chunk, dtype=np.uint8) == ord('\n'))
+                # sample line k begins right after the k-th newline
+                line_numbers = np.arange(
+                    n_newlines, n_newlines + newlines.size)
+                offsets.append(
+                    base + newlines[line_numbers % self.index_every == 0] + 1)
+                n_newlines += newlines.size
+                base += len(chunk)
+                last_byte = chunk[-1:]
+
+        filesize = base
+        # the last line might not be terminated
+        n_lines = n_newlines + (last_byte != b'\n')
+        self.nsamples_total = max(0, n_lines - 1)
+        self.line_offsets = np.concatenate(
+            offsets + [np.array([], dtype=np.int64)]).astype(np.int64)
+        self.line_offsets = self.line_offsets[self.line_offsets < filesize]
+
     def read_samples(self, nsamples, offset=0):
         if nsamples > self.nsamples_total - offset:
             raise ValueError(
                 'Requested number of samples is larger than the available {} samples.'.format(self.nsamples_total))
 
-        x = np.genfromtxt(self.filename, dtype=np.float32, delimiter='|')
-        self.fs = x[0, 0]
-        self.center = x[0, 1]
-        all_data = x[1:, :]
-        all_data = all_data.view(np.complex64)[:, 0]
+        if self.is_cache_valid():
+            cache = np.load(self.get_cache_filename(), mmap_mode='r')
+            self.data_array = np.array(
+                cache[offset:offset + nsamples], dtype=self.dtype)
+            return
+
+        self.data_array = self.parse_lines(
+            nsamples, offset).astype(self.dtype, copy=False)
+
+    def parse_lines(self, nsamples, offset=0):
+        """
+        Parse only the lines of the requested samples, starting from the nearest indexed line.
+        """
+        if nsamples == 0:
+            return np.zeros(0, dtype=np.complex64)
+
+        first = offset // self.index_every
+        last = (offset + nsamples - 1) // self.index_every + 1
+        with open(self.filename, 'rb') as f:
+            f.seek(self.line_offsets[first])
+            if last < self.line_offsets.size:
+                ba = f.read(self.line_offsets[last] - self.line_offsets[first])
+            else:
+                ba = f.read()
+
+        skip = offset - first * self.index_every
+        lines = ba.split(b'\n')[skip:skip + nsamples]
+        # re|im on every line, read all numbers at once as I, Q, I, Q...
+        text = b' '.join(lines).replace(b'|', b' ').decode()
+        x = np.fromstring(text, dtype=np.float32, sep=' ')
+        if x.size != 2 * nsamples:
+            raise ValueError(
+                'Could not parse {} samples from line {} on.'.format(nsamples, offset + 2))
+        return x.view(np.complex64)
+
+    def get_cache_filename(self):
+        return self.filename + '.cache.npy'
+
+    def is_cache_valid(self):
+        cache = self.get_cache_filename()
+        return os.path.exists(cache) and os.path.getmtime(cache) >= os.path.getmtime(self.filename)
 
-        self.data_array = all_data[offset:nsamples + offset]
+    def convert_to_cache(self, nsamples_per_chunk=2 ** 20):
+        """
+        Convert the ASCII file once to a binary complex64 numpy file next to it. Later reads
+        memory map the binary file instead of parsing text.
+        """
+        cache = np.lib.format.open_memmap(self.get_cache_filename(), mode='w+',
+                                          dtype=np.complex64, shape=(self.nsamples_total,))
+        for offset in range(0, self.nsamples_total, nsamples_per_chunk):
+            n = min(nsamples_per_chunk, self.nsamples_total - offset)
+            cache[offset:offset + n] = self.parse_lines(n, offset)
+        cache.flush()
+        del cache
+        log.info('Binary cache written to {}.'.format(
+            self.get_cache_filename()))
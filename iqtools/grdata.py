@@ -20,22 +20,28 @@ class GRData(IQBase):
         self.center = center
         self.date_time = date_time
         # each complex64 sample is 8 bytes on disk
-        self.nsamples_total = os.path.getsize(filename) / 8
+        self.nsamples_total = os.path.getsize(filename) // 8
 
     def read(self, nframes=10, lframes=1024, sframes=0):
         self.read_samples(nframes * lframes, offset=sframes * lframes)
 
     def read_complete_file(self):
         """
-        Read a complete TDMS file
+        Read a complete GNU Radio file
         :return:
         """
         filesize = os.path.getsize(self.filename)
-        self.nsamples_total = filesize / 8
-        self.data_array = np.fromfile(self.filename, dtype=np.complex64)
-
+        self.nsamples_total = filesize // 8
+        self.data_array = np.fromfile(
+            self.filename, dtype=np.complex64).astype(self.dtype, copy=False)
 
     def read_samples(self, nsamples, offset=0):
+        """
+        Read only the requested samples, the file has no header
+        """
+        if nsamples > self.nsamples_total - offset:
+            raise ValueError(
+                'Requested number of samples is larger than the available {} samples.'.format(self.nsamples_total))
 
-        # TODO:
-        pass
+        self.data_array = np.fromfile(
+            self.filename, dtype=np.complex64, count=nsamples, offset=offset * 8).astype(self.dtype, copy=False)
@@ -6,11 +6,76 @@ Xaratustrah Aug-2015
 """
 
 import os
+import logging as log
 import numpy as np
-from scipy.signal import welch, find_peaks_cwt
 from abc import ABCMeta, abstractmethod
-from scipy.signal.windows import dpss
-from multitaper import *
+from functools import lru_cache
+
+# sample precisions, complex64 is enough for data from 16 bit ADCs
+PRECISIONS = {'complex64': np.complex64, 'complex128': np.complex128}
+default_precision = 'complex64'
+
+
+def set_default_precision(precision):
+    """
+    Set the precision of all objects created from now on, either 'complex64' or 'complex128'.
+    The precision of a single object can be changed using its precision field.
+    """
+    global default_precision
+    if precision not in PRECISIONS:
+        raise ValueError('Precision must be one of {}.'.format(list(PRECISIONS)))
+    default_precision = precision
+
+
+@lru_cache(maxsize=128)
+def get_cached_array(kind, n, dtype, params=()):
+    """
+    Windows, frequency axes and DPSS tapers are used again and again with the same parameters, so they
+    are calculated once and kept in a bounded LRU cache. The arrays are read only, copy them before
+    changing them. get_cached_array.cache_info() shows the hits and misses.
+
+    :param kind: 'window', 'welch' (scipy's default Welch window), 'fftfreq', 'rfftfreq', 'specfreq' or 'dpss'
+    :param n: length
+    :param dtype: data type of the result, e.g. 'float32'
+    :param params: window name for windows, sampling frequency for frequency axes, (NW, Kmax) for tapers
+    :return: read only array
+    """
+    if kind == 'window':
+        window = params[0]
+        if window == 'rectangular':
+            arr = np.ones(n)
+        elif window == 'bartlett':
+            arr = np.bartlett(n)
+        elif window == 'blackman':
+            arr = np.blackman(n)
+        elif window == 'hamming':
+            arr = np.hamming(n)
+        else:
+            arr = np.hanning(n)
+    elif kind == 'fftfreq':
+        arr = np.fft.fftshift(np.fft.fftfreq(n, 1.0 / params[0]))
+    elif kind == 'rfftfreq':
+        arr = np.fft.rfftfreq(n, 1.0 / params[0])
+    elif kind == 'specfreq':
+        arr = (np.arange(n) - (n - 1) / 2) * params[0] / n
+    elif kind == 'welch':
+        from scipy.signal import get_window
+        arr = get_window('hann', n)
+    elif kind == 'dpss':
+        from scipy.signal.windows import dpss
+        arr = dpss(M=n, NW=params[0], Kmax=params[1])
+    else:
+        raise ValueError('Unknown kind of array {}.'.format(kind))
+    arr = arr.astype(dtype)
+    arr.setflags(write=False)
+    return arr
+
+
+def get_cache_info():
+    """
+    Hits, misses and size of the cache for windows, frequency axes and tapers
+    """
+    return get_cached_array.cache_info()
 
 
 class IQBase(object):
@@ -19,6 +84,10 @@ class IQBase(object):
     """
     __metaclass__ = ABCMeta
 
+    # True for readers of 16 bit I and Q values with one constant scale for the whole file,
+    # which can then be stored losslessly as raw int16 values
+    constant_int16_scale = False
+
     def __init__(self, filename):
 
         # fields required in all subclasses
@@ -35,6 +104,10 @@ class IQBase(object):
         self.filename_wo_ext = os.path.splitext(filename)[0]
         self.window = 'rectangular'
         self.method = 'fft'
+        self.precision = default_precision
+        # FFT backend of the spectrogram, 'scipy' or 'numpy', workers=-1 uses all cores
+        self.fft_backend = 'scipy'
+        self.fft_workers = -1
 
     def __str__(self):
         return self.dic2htmlstring(vars(self))
@@ -73,6 +146,27 @@ class IQBase(object):
                 self.date_time)
             return outstr
 
+    @property
+    def dtype(self):
+        """
+        Complex data type of the samples, according to the precision
+        """
+        return np.dtype(PRECISIONS[self.precision])
+
+    @property
+    def real_dtype(self):
+        """
+        Real data type of the same precision, e.g. for windows and the I and Q parts
+        """
+        return np.finfo(self.dtype).dtype
+
+    def to_precision(self, x):
+        """
+        Convert complex or real data to the precision of this object, without a copy if it already has it
+        """
+        x = np.asarray(x)
+        return x.astype(self.real_dtype if np.isrealobj(x) else self.dtype, copy=False)
+
     def get_record_length(self):
         return self.nsamples_total / self.fs
 
@@ -84,21 +178,70 @@ class IQBase(object):
     def read_samples(self, nsamples, offset):
         pass
 
+    def iter_chunks(self, lframes, nframes_per_chunk=100, hop=None, start=0, stop=None):
+        """
+        Go through the samples between start and stop chunk by chunk, using read_samples of the subclass.
+        Each chunk is a 2D array of up to nframes_per_chunk frames of length lframes, a new frame begins
+        every hop samples. Frames overlap if hop is smaller than lframes, in that case the overlapping
+        samples are carried over to the next chunk instead of being read again. The last chunk contains only
+        the remaining complete frames.
+
+        The chunks are read only views into one buffer which is reused for the next chunk, so copy a chunk if
+        it is needed later on. Please note that self.data_array is overwritten while iterating.
+
+        :param lframes: length of each frame
+        :param nframes_per_chunk: number of frames in each chunk
+        :param hop: distance between the beginnings of two frames, default is lframes
+        :param start: first sample
+        :param stop: end sample, default is the end of the data
+        :return: generator of 2D arrays of shape (nframes, lframes)
+        """
+        if not hop:
+            hop = lframes
+        buffer = None
+        prev_begin = prev_end = start
+        for nframes, begin, end in self.get_chunk_bounds(lframes, nframes_per_chunk, hop, start, stop):
+            # overlapping samples of the previous chunk move to the front of the buffer
+            keep = max(0, prev_end - begin)
+            if keep:
+                buffer[:keep] = buffer[begin -
+                                       prev_begin:prev_end - prev_begin]
+
+            self.read_samples(end - begin - keep, begin + keep)
+            if buffer is None:
+                buffer = np.empty((nframes_per_chunk - 1) * hop + lframes,
+                                  dtype=self.data_array.dtype)
+            buffer[keep:end - begin] = self.data_array
+            prev_begin, prev_end = begin, end
+
+            yield np.lib.stride_tricks.as_strided(buffer, shape=(nframes, lframes),
+                                                  strides=(hop * buffer.itemsize, buffer.itemsize),
+                                                  writeable=False)
+
+    def get_chunk_bounds(self, lframes, nframes_per_chunk=100, hop=None, start=0, stop=None):
+        """
+        Chunks of iter_chunks as a list of the number of frames, first and end sample of each chunk.
+        """
+        if not hop:
+            hop = lframes
+        if stop is None or stop > self.nsamples_total:
+            stop = self.nsamples_total
+        if stop - start < lframes:
+            return []
+        nframes_total = (stop - start - lframes) // hop + 1
+        bounds = []
+        for first_frame in range(0, nframes_total, nframes_per_chunk):
+            nframes = min(nframes_per_chunk, nframes_total - first_frame)
+            begin = start + first_frame * hop
+            bounds.append((nframes, begin, begin + (nframes - 1) * hop + lframes))
+        return bounds
+
     def get_window(self, n=None):
         if not n:
             n = self.lframes
         assert self.window in ['rectangular',
                                'bartlett', 'blackman', 'hamming', 'hanning']
-        if self.window == 'rectangular':
-            return np.ones(n)
-        elif self.window == 'bartlett':
-            return np.bartlett(n)
-        elif self.window == 'blackman':
-            return np.blackman(n)
-        elif self.window == 'hamming':
-            return np.hamming(n)
-        else:
-            return np.hanning(n)
+        return get_cached_array('window', int(n), self.real_dtype.name, (self.window,))
 
     def get_fft_freqs_only(self, x=None):
         """
@@ -108,10 +251,7 @@ class IQBase(object):
             data = self.data_array
         else:
             data = x
-        n = data.size
-        ts = 1.0 / self.fs
-        f = np.fft.fftfreq(n, ts)
-        return np.fft.fftshift(f)
+        return get_cached_array('fftfreq', data.size, 'float64', (float(self.fs),))
 
     def get_fft(self, x=None, nframes=0, lframes=0):
         """
@@ -141,13 +281,16 @@ class IQBase(object):
         else:
             data = x
 
+        import scipy.fft
         termination = 50  # in Ohms for termination resistor
-        data = np.reshape(data, (nf, lf))
+        data = np.reshape(self.to_precision(data), (nf, lf))
         freqs = self.get_fft_freqs_only(data[0])
-        v_peak_iq = np.fft.fft(
-            data * self.get_window(lf), axis=1)
+        # unlike np.fft, scipy.fft keeps single precision
+        v_peak_iq = scipy.fft.fft(
+            data * self.get_window(lf), axis=1, workers=self.fft_workers)
         v_peak_iq = np.average(v_peak_iq, axis=0) / lf * nf
-        v_rms = abs(v_peak_iq) / np.sqrt(2)
+        # python floats as constants, so that the precision is kept
+        v_rms = abs(v_peak_iq) / 2 ** 0.5
         p_avg = v_rms ** 2 / termination
         # freqs is already fft shifted
         return freqs, np.fft.fftshift(p_avg), np.fft.fftshift(v_peak_iq)
@@ -158,16 +301,18 @@ class IQBase(object):
         :param x: if available the data segment, otherwise the whole data will be taken
         :return: fft and power in Watts
         """
+        from scipy.signal import welch
         if x is None:
             data = self.data_array
         else:
             data = x
+        data = self.to_precision(data)
         n = data.size
         f, p_avg = welch(data * self.get_window(n), self.fs,
                          nperseg=data.size, return_onesided=False)
         return np.fft.fftshift(f), np.fft.fftshift(p_avg)
 
-    def get_spectrogram(self, nframes, lframes):
+    def get_spectrogram(self, nframes, lframes, hop=None):
         """
         Go through the data frame by frame and perform transformation. They can be plotted using pcolormesh
         x, y and z are ndarrays and have the same shape. In order to access the contents use these kind of
@@ -183,40 +328,227 @@ class IQBase(object):
         for i in range (ncols):
             plt.plot(y[:,i], z[:, i])
 
+        Frames overlap if hop is smaller than lframes. For real data, the fft method only delivers the
+        positive frequencies.
+
+        :param nframes: number of frames
+        :param lframes: length of each frame
+        :param hop: distance between the beginnings of two frames, default is lframes
         :return: frequency, time and power for XYZ plot,
         """
+        if not hop:
+            hop = lframes
+        zz = self.get_spectrogram_frames(
+            self.get_frames_view(nframes, lframes, hop))
 
-        assert self.method in ['fft', 'welch', 'mtm']
+        # create a mesh grid from 0 to nframes -1 in Y direction
+        xx, yy = np.meshgrid(self.get_spectrogram_freqs(lframes, np.isrealobj(self.data_array)),
+                             np.arange(nframes) * hop / self.fs)
+
+        return xx, yy, zz
+
+    def get_frames_view(self, nframes, lframes, hop=None):
+        """
+        Read only view of the data array as frames, without copying. A new frame begins every hop samples.
 
-        # define an empty np-array for appending
-        pout = np.zeros(nframes * lframes)
+        :return: 2D array of shape (nframes, lframes)
+        """
+        if not hop:
+            hop = lframes
+        data = np.ascontiguousarray(self.data_array)
+        if (nframes - 1) * hop + lframes > data.size:
+            raise ValueError(
+                'Requested number of samples is larger than the available {} samples.'.format(data.size))
+        return np.lib.stride_tricks.as_strided(data, shape=(nframes, lframes),
+                                               strides=(hop * data.itemsize, data.itemsize),
+                                               writeable=False)
+
+    def get_spectrogram_freqs(self, lframes, real=False):
+        """
+        Frequency axis of the spectrogram. Real data transformed with the fft method have only the positive
+        frequencies.
+        """
+        if real and self.method == 'fft':
+            return get_cached_array('rfftfreq', int(lframes), 'float64', (float(self.fs),))
+        return get_cached_array('specfreq', int(lframes), 'float64', (float(self.fs),))
+
+    def get_spectrogram_frames(self, sig):
+        """
+        Transform the frames in a 2D array of shape (nframes, lframes) according to the method.
+
+        :param sig: 2D array with one frame in each row
+        :return: 2D array with one spectrum in each row, fft shifted. Real data transformed with the
+                 fft method have only lframes // 2 + 1 positive frequencies.
+        """
+        assert self.method in ['fft', 'welch', 'mtm']
+        assert self.fft_backend in ['scipy', 'numpy']
+        nframes, lframes = np.shape(sig)
 
         if self.method == 'fft':
-            sig = np.reshape(self.data_array, (nframes, lframes))
-            zz = np.abs(np.fft.fftshift(np.fft.fft(sig, axis=1), axes=1))
+            if self.window != 'rectangular':
+                sig = sig * self.get_window(lframes)
+            if self.fft_backend == 'scipy':
+                import scipy.fft as fft_module
+                kwargs = {'workers': self.fft_workers}
+            else:
+                fft_module = np.fft
+                kwargs = {}
+            if np.isrealobj(sig):
+                zz = np.abs(fft_module.rfft(sig, axis=1, **kwargs))
+            else:
+                zz = np.abs(np.fft.fftshift(
+                    fft_module.fft(sig, axis=1, **kwargs), axes=1))
+            zz = zz.astype(self.real_dtype, copy=False)
 
         elif self.method == 'welch':
-            # go through the data array section wise and create a results array
-            for i in range(nframes):
-                f, p = self.get_pwelch(
-                    self.data_array[i * lframes:(i + 1) * lframes] * self.get_window(lframes))
-                pout[i * lframes:(i + 1) * lframes] = p
-            # fold the results array to the mesh grid
-            zz = np.reshape(pout, (nframes, lframes))
+            zz = np.empty((nframes, lframes), dtype=self.real_dtype)
+            self.map_frame_blocks(self.get_welch_block, sig, zz)
 
         elif self.method == 'mtm':
-            mydpss = dpss(M=lframes, NW=4, Kmax=6)
-            #f = self.get_fft_freqs_only(x[0:lframes])
-            sig = np.reshape(self.data_array, (nframes, lframes))
-            zz = pmtm(sig, mydpss, axis=1)
+            zz = np.empty((nframes, lframes), dtype=self.real_dtype)
+            self.map_frame_blocks(self.get_mtm_block, sig, zz)
 
-        # create a mesh grid from 0 to nframes -1 in Y direction
-        xx, yy = np.meshgrid(np.arange(lframes), np.arange(nframes))
-        yy = yy * lframes / self.fs
-        xx = xx - xx[-1, -1] / 2
-        xx = xx * self.fs / lframes
+        return zz
 
-        return xx, yy, zz
+    def map_frame_blocks(self, func, sig, zz, nframes_per_block=64):
+        """
+        Calculate the spectra of the frames in parallel on a thread pool with fft_workers threads. Each
+        thread goes through its share of the frames in blocks, calling func(frames, out, buffer) which
+        returns the buffer, so that a thread reuses its buffers from block to block.
+
+        :param func: function transforming a block of frames into out
+        :param sig: 2D array with one frame in each row
+        :param zz: 2D results array
+        :param nframes_per_block: number of frames transformed at once by one thread
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        nframes = len(sig)
+        n_workers = os.cpu_count() if self.fft_workers == -1 else self.fft_workers
+        n_workers = max(1, min(n_workers, -(-nframes // nframes_per_block)))
+        bounds = np.linspace(0, nframes, n_workers + 1).astype(int)
+
+        def work(begin, end):
+            buffer = None
+            for i in range(begin, end, nframes_per_block):
+                j = min(i + nframes_per_block, end)
+                buffer = func(sig[i:j], zz[i:j], buffer)
+
+        if n_workers == 1:
+            work(0, nframes)
+            return
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            # list() raises exceptions of the threads here
+            list(executor.map(work, bounds[:-1], bounds[1:]))
+
+    def get_welch_block(self, frames, out, buffer=None):
+        """
+        Welch spectra of a block of frames with 2D FFTs, giving the same result as get_pwelch applied to each
+        windowed frame on its own, i.e. one segment per frame with scipy's default Hann window, constant
+        detrending and density scaling.
+        """
+        import scipy.fft
+        nframes, lframes = np.shape(frames)
+        if buffer is None:
+            buffer = np.empty(np.shape(frames), dtype=self.dtype)
+        x = buffer[:nframes]
+        # the frame is windowed, then get_pwelch windows it once more
+        window = self.get_window(lframes)
+        np.multiply(frames, window * window, out=x)
+        x -= x.mean(axis=1, keepdims=True)
+        hann = get_cached_array('welch', lframes, self.real_dtype.name)
+        x *= hann
+        p = scipy.fft.fft(x, axis=1, workers=1)
+        p = p.real ** 2 + p.imag ** 2
+        p *= 1 / (self.fs * np.sum(hann.astype(float) ** 2))
+        out[:] = np.fft.fftshift(p, axes=1)
+        return buffer
+
+    def get_mtm_block(self, frames, out, buffer=None, nw=4, kmax=6):
+        """
+        Multitaper spectra of a block of frames, i.e. the mean of the eigenspectra of the DPSS tapers,
+        fft shifted.
+        """
+        import scipy.fft
+        nframes, lframes = np.shape(frames)
+        tapers = get_cached_array('dpss', lframes, self.real_dtype.name, (nw, kmax))
+        if buffer is None:
+            buffer = np.empty((nframes, kmax, lframes), dtype=self.dtype)
+        x = buffer[:nframes]
+        np.multiply(frames[:, np.newaxis, :], tapers, out=x)
+        p = scipy.fft.fft(x, axis=2, workers=1, overwrite_x=True)
+        p = p.real ** 2 + p.imag ** 2
+        out[:] = np.fft.fftshift(p.mean(axis=1), axes=1)
+        return buffer
+
+    def get_spectrogram_to_file(self, filename, lframes, nframes_per_chunk=100, hop=None, start=0, stop=None):
+        """
+        Out of core spectrogram of the samples between start and stop, for files which do not fit into
+        the memory. The data are read chunk by chunk and the spectra are written into a numpy file on disk,
+        which is returned as a memory map. The progress is kept in a JSON file next to it, so an interrupted
+        calculation with the same parameters and unchanged source files continues where it stopped when called again.
+
+        In contrast to get_spectrogram, the frequency and time axes are returned as 1D arrays. They can be
+        turned into a mesh grid using np.meshgrid(f, t) if needed.
+
+        :param filename: name of the numpy file for the results, e.g. 'spectrogram.npy'
+        :param lframes: length of each frame
+        :param nframes_per_chunk: number of frames to read and transform at once
+        :param hop: distance between the beginnings of two frames, default is lframes
+        :param start: first sample
+        :param stop: end sample, default is the end of the data
+        :return: frequency, time and a memory map of the power with shape (len(t), len(f))
+        """
+        import json
+        if not hop:
+            hop = lframes
+        if stop is None or stop > self.nsamples_total:
+            stop = self.nsamples_total
+        if stop - start < lframes:
+            raise ValueError(
+                'Requested number of samples is larger than the available {} samples.'.format(stop - start))
+        nframes = int((stop - start - lframes) // hop + 1)
+
+        # real data have only the positive frequencies in the fft method
+        self.read_samples(1, start)
+        real = np.isrealobj(self.data_array)
+        freqs = self.get_spectrogram_freqs(lframes, real)
+
+        # size and modification time of the source files, so a rewritten or grown file starts over
+        sources = [[os.path.abspath(name), os.stat(name).st_size, os.stat(name).st_mtime_ns]
+                   for name in getattr(self, 'segment_filenames', [self.filename])]
+        params = {'source': sources, 'lframes': int(lframes), 'hop': int(hop),
+                  'start': int(start), 'stop': int(stop), 'method': self.method,
+                  'window': self.window, 'precision': self.precision}
+        progress_filename = filename + '.json'
+        nframes_done = 0
+        zz = None
+        if os.path.exists(filename) and os.path.exists(progress_filename):
+            with open(progress_filename) as f:
+                progress = json.load(f)
+            if progress.get('params') == params:
+                zz = np.lib.format.open_memmap(filename, mode='r+')
+                nframes_done = progress['nframes_done']
+                log.info('Resuming spectrogram at frame {} of {}.'.format(
+                    nframes_done, nframes))
+            else:
+                log.info('Parameters have changed, starting a new spectrogram.')
+        if zz is None:
+            zz = np.lib.format.open_memmap(filename, mode='w+', dtype=self.real_dtype,
+                                           shape=(nframes, len(freqs)))
+
+        chunks = self.iter_chunks(lframes, nframes_per_chunk, hop=hop,
+                                  start=start + nframes_done * hop,
+                                  stop=start + (nframes - 1) * hop + lframes)
+        for chunk in chunks:
+            zz[nframes_done:nframes_done + len(chunk)] = self.get_spectrogram_frames(chunk)
+            nframes_done += len(chunk)
+            # write the results before the progress, so the progress never runs ahead
+            zz.flush()
+            with open(progress_filename, 'w') as f:
+                json.dump({'params': params, 'nframes_done': nframes_done}, f)
+
+        t = (np.arange(nframes) * hop + start) / self.fs
+        return freqs, t, zz
 
     @staticmethod
     def get_averaged_spectrogram(xa, ya, za, every):
@@ -224,11 +556,15 @@ class IQBase(object):
         Averages a spectrogram in time, given every such frames in n_time_frames
         example: a spectrogram with 100 frames in time each 1024 bins in frequency
         will be averaged every 5 frames in time bin by bin, resulting in a new spectrogram
-        with only 20 frames and same frame length as original.
+        with only 20 frames and same frame length as original. Remaining frames which
+        do not fill a group are dropped, see also SpectrogramAccumulator for averaging
+        while streaming.
 
         """
         rows, cols = np.shape(za)
         dim3 = int(rows / every)
+        za = za[:dim3 * every]
+        ya = ya[:dim3 * every]
 
         # This is such an ndarray gymnastics I think I would never be
         # able to figure out ever again how I managed it,
@@ -250,12 +586,11 @@ class IQBase(object):
         :param zz: from spectrogram
         :return: Flattened array for 2D plot
         """
-        # Slices parallel to frequency axis
-        n_time_frames = np.shape(xx)[0]
-        dp_p = np.zeros(n_time_frames)
-        for i in range(n_time_frames):
-            fwhm, f_peak, _, _ = IQBase.get_fwhm(xx[i, :], zz[i, :], skip=20)
-            dp_p[i] = fwhm / (f_peak + self.center) / eta
+        # all slices parallel to frequency axis at once
+        fwhm, _, _, _, _ = IQBase.get_fwhm_batch(xx, zz, skip=20)
+        # get_fwhm returns the peak level in dBm, the frequency of the peak is needed here
+        f_peak = np.take_along_axis(xx, zz.argmax(axis=1)[:, np.newaxis], axis=1)[:, 0]
+        dp_p = fwhm / (f_peak + self.center) / eta
 
         # Flatten array for 2D plot
         return yy[:, 0], dp_p
@@ -268,21 +603,59 @@ class IQBase(object):
         :param zz: from spectrogram
         :return: Flattened array for 2D plot
         """
-        # Slices parallel to frequency axis
-        n_time_frames = np.shape(xx)[0]
-        frame_power = np.zeros(n_time_frames)
-        for i in range(n_time_frames):
-            frame_power[i] = self.get_channel_power(xx[i, :], zz[i, :])
+        # same as get_channel_power over the whole frame, for all frames at once
+        frame_power = np.sum(zz, axis=1) / self.get_nbw()
 
         # Flatten array for 2D plot
         return yy[:, 0], frame_power
 
+    def get_channel_power_vs_time(self, xx, yy, zz, bands):
+        """
+        Channel power of several frequency bands for all frames at once, e.g. for monitoring several
+        revolution harmonics. The bands include their limits like get_channel_power.
+
+        :param xx: from spectrogram
+        :param yy: from spectrogram
+        :param zz: from spectrogram
+        :param bands: list of (low, high) frequencies, in the same units as xx
+        :return: time and power in Watts with one column per band
+        """
+        begin, end = IQBase.get_band_indexes(xx[0, :], bands)
+        return yy[:, 0], IQBase.get_band_sum(zz, begin, end) / self.get_nbw()
+
     @staticmethod
     def get_frame_sum_vs_time(xx, yy, zz):
-        summ = np.zeros(np.shape(zz)[0])
-        for i in range(len(summ)):
-            summ[i] = np.sum(zz[i, :])
-        return yy[:, 0], summ
+        return yy[:, 0], np.sum(zz, axis=1)
+
+    @staticmethod
+    def get_band_indexes(f, bands):
+        """
+        Bin index ranges of frequency bands, to be calculated once for many frames.
+
+        :param f: ascending frequencies
+        :param bands: list of (low, high) frequencies, the limits are included
+        :return: begin and end indexes, so that the band k covers f[begin[k]:end[k]]
+        """
+        bands = np.reshape(bands, (-1, 2))
+        begin = np.searchsorted(f, bands[:, 0], side='left')
+        end = np.searchsorted(f, bands[:, 1], side='right')
+        return begin, np.maximum(begin, end)
+
+    @staticmethod
+    def get_band_sum(zz, begin, end):
+        """
+        Sum of the bins within each band for every frame, using cumulative sums.
+
+        :param zz: 2D array of spectra, one frame in each row
+        :param begin: begin indexes from get_band_indexes
+        :param end: end indexes from get_band_indexes
+        :return: 2D array with one row per frame and one column per band
+        """
+        zz = np.atleast_2d(zz)
+        # cumulative sums in double precision, starting with zero
+        cumsum = np.zeros((np.shape(zz)[0], np.shape(zz)[1] + 1))
+        np.cumsum(zz, axis=1, out=cumsum[:, 1:])
+        return cumsum[:, end] - cumsum[:, begin]
 
     @staticmethod
     def get_fwhm(f, p, skip=None):
@@ -324,6 +697,62 @@ class IQBase(object):
         # return watt values not dbm
         return fwhm, f_peak, np.array([index_m3db, index_p3db]), np.array([f_m3db, f_p3db]), np.array([p_m3db, p_p3db])
 
+    @staticmethod
+    def get_fwhm_batch(f, p, skip=None, interpolate=False):
+        """
+        Full width at half maximum of every row of a spectrogram at once, giving the same results as get_fwhm
+        applied to each row. Also the skip works the same way, i.e. on the plus side the bins with an index
+        below skip are skipped, on the minus side the skip bins next to the peak.
+
+        :param f: frequencies, either 1D or 2D like xx of the spectrogram
+        :param p: 2D array of powers in Watts, one spectrum in each row
+        :param skip: Sometimes peaks have a dip, skip this number of bins, use with care or visual inspection
+        :param interpolate: interpolate linearly in dBm between the bins to find the -3 dB points
+        :return: arrays with one value per row like get_fwhm, i.e. fwhm, peak in dBm (f_peak), indexes,
+                 frequencies and powers of the -3 dB points with shape (rows, 2)
+        """
+        p = np.atleast_2d(p)
+        rows, cols = np.shape(p)
+        f = np.broadcast_to(f, (rows, cols))
+        if not skip:
+            skip = 0
+        p_dbm = IQBase.get_dbm(p)
+        f_peak_index = p_dbm.argmax(axis=1)
+        f_peak = np.take_along_axis(p_dbm, f_peak_index[:, np.newaxis], axis=1)[:, 0]
+        level = f_peak - 3
+
+        index = np.arange(cols)
+        peak = f_peak_index[:, np.newaxis]
+        below = p_dbm <= level[:, np.newaxis]
+        # first bin below the level right of the peak, last one left of the peak
+        mask_p3db = below & (index >= peak) & (index >= skip)
+        mask_m3db = below & (index <= peak) & (peak - index >= skip)
+        found = np.stack([mask_m3db.any(axis=1), mask_p3db.any(axis=1)], axis=1)
+        index_3db = np.stack([cols - 1 - mask_m3db[:, ::-1].argmax(axis=1),
+                              mask_p3db.argmax(axis=1)], axis=1)
+        index_3db[~found] = 0
+
+        f_3db = np.take_along_axis(f, index_3db, axis=1)
+        p_3db = np.take_along_axis(p, index_3db, axis=1)
+        if interpolate:
+            # neighbouring bins towards the peak, which are above the level
+            neighbour = np.clip(index_3db + [1, -1], 0, cols - 1)
+            dbm_3db = np.take_along_axis(p_dbm, index_3db, axis=1)
+            dbm_neighbour = np.take_along_axis(p_dbm, neighbour, axis=1)
+            f_neighbour = np.take_along_axis(f, neighbour, axis=1)
+            valid = found & (neighbour != index_3db) & (dbm_neighbour > dbm_3db)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                frac = (level[:, np.newaxis] - dbm_3db) / \
+                    (dbm_neighbour - dbm_3db)
+                f_3db = np.where(valid, f_3db + frac *
+                                 (f_neighbour - f_3db), f_3db)
+            p_3db = np.where(valid, IQBase.get_watt(level)[:, np.newaxis], p_3db)
+        f_3db = np.where(found, f_3db, 0)
+        p_3db = np.where(found, p_3db, 0)
+
+        fwhm = f_3db[:, 1] - f_3db[:, 0]
+        return fwhm, f_peak, index_3db, f_3db, p_3db
+
     @staticmethod
     def get_sigma_estimate(f, p):
         p_peak = p.max()
@@ -355,6 +784,7 @@ class IQBase(object):
         :param accuracy:
         :return:
         """
+        from scipy.signal import find_peaks_cwt
         # convert to dbm for convenience
         p_dbm = IQBase.get_dbm(p)
         peak_ind = find_peaks_cwt(p_dbm, np.arange(1, accuracy))
@@ -379,7 +809,7 @@ class IQBase(object):
         :return: value in dBm
         """
         if isinstance(watt, np.ndarray):
-            watt[watt <= 0] = 10 ** -30
+            watt = np.where(watt <= 0, 10 ** -30, watt)
         return 10 * np.log10(np.array(watt) * 1000)
 
     @staticmethod
@@ -390,6 +820,15 @@ class IQBase(object):
         """
         return 10 ** (np.array(dbm) / 10) / 1000
 
+    def get_nbw(self):
+        """
+        Noise bandwidth from the resolution bandwidth
+        """
+        # based on agilent application note on RBW and ENBW
+        # for typical FFT based analysers
+        #nbw = self.rbw * 5
+        return self.rbw * 1.056
+
     def get_channel_power(self, f, p, span=None):
         """ Return total power in band in Watts
         Input: average power in Watts
@@ -399,10 +838,7 @@ class IQBase(object):
         else:
             mask = (f <= span / 2) & (f >= -span / 2)
 
-        # based on agilent application note on RBW and ENBW
-        # for typical FFT based analysers
-        #nbw = self.rbw * 5
-        nbw = self.rbw * 1.056
+        nbw = self.get_nbw()
         summ = np.sum(p[mask])
         # ACQ bandwidth here is a better measure.
         # correct formula uses NBW
@@ -0,0 +1,151 @@
+"""
+Class for IQ Data
+IQC format, the canonical cache format of iqtools
+
+Any other format can be converted once to IQC using write_timedata_to_iqc
+in the tools. The samples are stored contiguously either as complex64 or
+as interleaved raw int16 I and Q values, with a JSON sidecar file holding
+the metadata and some statistics of every chunk written.
+"""
+
+import json
+import logging as log
+import numpy as np
+from iqtools.iqbase import IQBase
+
+IQC_VERSION = 1
+
+
+class IQCData(IQBase):
+    def __init__(self, filename):
+        super().__init__(filename)
+
+        # Additional fields in this subclass
+        self.center = 0.0
+        self.date_time = ''
+        self.sample_format = 'complex64'
+        self.chunk_stats = {}
+        self.raw_memmap = None
+
+        self.read_header()
+
+    def read(self, nframes=10, lframes=1024, sframes=0):
+        self.read_samples(nframes * lframes, offset=sframes * lframes)
+
+    @staticmethod
+    def get_sidecar_filename(filename):
+        return filename + '.json'
+
+    def read_header(self):
+        """
+        Read the JSON sidecar file
+        """
+        with open(self.get_sidecar_filename(self.filename)) as f:
+            dic = json.load(f)
+        if dic['version'] != IQC_VERSION:
+            raise ValueError(
+                'IQC version {} is not supported.'.format(dic['version']))
+
+        self.sample_format = dic['sample_format']
+        self.nsamples_total = int(dic['nsamples'])
+        self.fs = float(dic['fs'])
+        self.center = float(dic['center'])
+        self.scale = float(dic['scale'])
+        self.date_time = dic['date_time']
+        self.chunk_stats = dic['chunks']
+        return dic
+
+    def get_raw_memmap(self):
+        """
+        Memory map the samples, either as complex64 or as pairs of int16 for I and Q.
+        """
+        if self.raw_memmap is None:
+            if self.sample_format == 'complex64':
+                dtype, shape = np.complex64, (self.nsamples_total,)
+            else:
+                dtype, shape = '<i2', (self.nsamples_total, 2)
+            self.raw_memmap = np.memmap(
+                self.filename, dtype=dtype, mode='r', shape=shape)
+        return self.raw_memmap
+
+    def read_samples(self, nsamples, offset=0):
+        """
+        Complex64 samples are returned as a read only view of the memory map without any copy, unless
+        a higher precision is requested. Int16 samples are scaled into a new array.
+        """
+        if nsamples > self.nsamples_total - offset:
+            raise ValueError(
+                'Requested number of samples is larger than the available {} samples.'.format(self.nsamples_total))
+
+        raw = self.get_raw_memmap()[offset:offset + nsamples]
+        if self.sample_format == 'complex64':
+            self.data_array = raw.astype(self.dtype, copy=False)
+        else:
+            self.data_array = np.empty(nsamples, dtype=self.dtype)
+            np.multiply(raw, self.scale,
+                        out=self.data_array.view(self.real_dtype).reshape(-1, 2))
+
+
+def write_iqc(iq_obj, filename=None, nsamples_per_chunk=2 ** 20, raw_int16=False):
+    """
+    Stream all samples of any reader into an IQC file, chunk by chunk.
+
+    :param iq_obj: object of any IQBase subclass
+    :param filename: output file name, by default the input file name with the extension .iqc
+    :param nsamples_per_chunk: number of samples read and written at once
+    :param raw_int16: store the samples divided by iq_obj.scale as int16 I and Q pairs instead of complex64.
+    This is only possible for readers of 16 bit data with a constant scale, i.e. with constant_int16_scale.
+    :return: name of the written file
+    """
+    if filename is None:
+        filename = iq_obj.filename_wo_ext + '.iqc'
+    if raw_int16 and not iq_obj.constant_int16_scale:
+        raise ValueError('{} has no constant 16 bit scale, raw int16 values can not be stored.'.format(
+            type(iq_obj).__name__))
+    scale = 1.0
+
+    stats = {'offset': [], 'nsamples': [], 'mean_power': [], 'max_abs': []}
+    with open(filename, 'wb') as f:
+        for offset in range(0, iq_obj.nsamples_total, nsamples_per_chunk):
+            n = min(nsamples_per_chunk, iq_obj.nsamples_total - offset)
+            iq_obj.read_samples(n, offset)
+            x = iq_obj.data_array
+            if raw_int16 and not offset:
+                # the scale is known for sure after the first read
+                scale = float(iq_obj.scale)
+                if not scale:
+                    raise ValueError('A scale is needed to store raw int16 values.')
+
+            stats['offset'].append(offset)
+            stats['nsamples'].append(n)
+            stats['mean_power'].append(float(np.mean(np.abs(x) ** 2)))
+            stats['max_abs'].append(float(np.max(np.abs(x))))
+
+            if raw_int16:
+                x_iq = np.stack((np.real(x), np.imag(x)), axis=1)
+                iq = np.rint(x_iq / scale)
+                if np.abs(iq).max(initial=0) > 32767:
+                    raise ValueError(
+                        'Samples do not fit into int16 with a scale of {}.'.format(scale))
+                # the samples must be whole multiples of the scale, otherwise the int16 values would be lossy
+                if not np.allclose(iq * scale, x_iq, rtol=1e-5, atol=scale * 1e-3):
+                    raise ValueError(
+                        'Samples at offset {} are not multiples of the scale {}.'.format(offset, scale))
+                iq.astype('<i2').tofile(f)
+            else:
+                x.astype(np.complex64).tofile(f)
+
+    dic = {'version': IQC_VERSION,
+           'sample_format': 'int16' if raw_int16 else 'complex64',
+           'nsamples': iq_obj.nsamples_total,
+           'fs': float(iq_obj.fs),
+           'center': float(getattr(iq_obj, 'center', 0.0)),
+           'scale': scale,
+           'date_time': str(getattr(iq_obj, 'date_time', '')),
+           'source': iq_obj.filename,
+           'chunks': stats}
+    with open(IQCData.get_sidecar_filename(filename), 'w') as f:
+        json.dump(dic, f, indent=1)
+    log.info('Written {} samples to {}.'.format(
+        iq_obj.nsamples_total, filename))
+    return filename
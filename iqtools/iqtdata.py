@@ -12,6 +12,8 @@ from iqtools.iqbase import IQBase
 
 
 class IQTData(IQBase):
+    constant_int16_scale = True
+
     def __init__(self, filename):
         super().__init__(filename)
 
@@ -24,19 +26,18 @@ class IQTData(IQBase):
         self.gain_offset = 0
         self.max_input_level = 0
         self.scale = 0
+        self.data_offset = 0
+        self.frame_type = None
 
-    def read_samples(self, nsamples, offset=0):
-        # TODO:
-        pass
+        self.read_iqt_header()
 
     def read(self, nframes=10, lframes=1024, sframes=0):
+        self.read_samples(nframes * lframes, offset=sframes * lframes)
+
+    def read_iqt_header(self):
         """
-        Read IQT Files
-        :return:
+        Read the text header in front of the binary section and define the frame layout
         """
-        # in iqt files, lframes is always fixed 1024 at the time of reading the file.
-        # At the usage time, the lframe can be changed from time data
-
         data_offset = 0
         with open(self.filename, 'rb') as f:
             ba = f.read(1)
@@ -48,6 +49,7 @@ class IQTData(IQBase):
             ba = f.read(header_size)
             data_offset += header_size
 
+        self.data_offset = data_offset
         self.header = ba.decode('utf8').split('\n')
         header_dic = self.read_header(self.header)
 
@@ -67,45 +69,49 @@ class IQTData(IQBase):
         self.scale = np.sqrt(np.power(
             10, (self.gain_offset + self.max_input_level + self.level_offset) / 10) / 20 * 2)
 
-        log.info("Proceeding to read binary section, 32bit (4 byte) little endian.")
-
         frame_header_type = np.dtype(
             {'names': ['reserved1', 'validA', 'validP', 'validI', 'validQ', 'bins', 'reserved2', 'triggered',
                        'overLoad', 'lastFrame', 'ticks'],
              'formats': [np.int16, np.int16, np.int16, np.int16, np.int16, np.int16, np.int16,
                          np.int16, np.int16, np.int16, np.int32]})
 
+        # in iqt files, the frame length is always fixed to the number of FFT points at the time of writing the file.
+        # At the usage time, the lframe can be changed from time data
         # 2 byte integer for Q, 2 byte integer for I
-        frame_data_type = np.dtype((np.int16, 2 * lframes))
-        frame_type = np.dtype({'names': ['header', 'data'],
-                               'formats': [(frame_header_type, 1), (frame_data_type, 1)]})
+        frame_data_type = np.dtype((np.int16, 2 * self.fft_points))
+        self.frame_type = np.dtype({'names': ['header', 'data'],
+                                    'formats': [(frame_header_type, 1), (frame_data_type, 1)]})
+
+    def read_samples(self, nsamples, offset=0):
+        """
+        Read IQT Files: only the frames covering the requested samples are read and decoded at once.
+        :return:
+        """
+        if nsamples > self.nsamples_total - offset:
+            raise ValueError(
+                'Requested number of samples is larger than the available {} samples.'.format(self.nsamples_total))
 
-        total_n_bytes = nframes * frame_type.itemsize
-        start_n_bytes = sframes * frame_type.itemsize
+        log.info("Proceeding to read binary section, 32bit (4 byte) little endian.")
 
-        # prepare an empty array with enough room
-        self.data_array = np.zeros(lframes * nframes, np.complex64)
+        first_frame = offset // self.fft_points
+        last_frame = (offset + nsamples - 1) // self.fft_points + 1
+        start = offset - first_frame * self.fft_points
 
         # Read n frames at once
-        try:
-            with open(self.filename, 'rb') as f:
-                f.seek(data_offset + start_n_bytes)
-                ba = f.read(total_n_bytes)
-        except:
+        frame_array = np.fromfile(self.filename, dtype=self.frame_type, count=last_frame - first_frame,
+                                  offset=self.data_offset + first_frame * self.frame_type.itemsize)
+        if frame_array.size < last_frame - first_frame:
             log.error('File seems to end here!')
             return
 
-        # print(len(ba))
-        frame_array = np.fromstring(ba, dtype=frame_type)
-
-        for i in range(frame_array.size):
-            temp_array = np.zeros(2 * lframes, np.int16)
-            temp_array[::2], temp_array[1::2] = frame_array[i]['data'][1::2], frame_array[i]['data'][::2]
-            temp_array = temp_array.astype(np.float32)
-            temp_array = temp_array.view(np.complex64)
-            self.data_array[i * lframes:(i + 1) * lframes] = temp_array
-        # and finally scale the data
-        self.data_array = self.data_array * self.scale
+        # Q and I pairs of all frames one after the other
+        qi = frame_array['data'].reshape(-1, 2)[start:start + nsamples]
+
+        # swap to I and Q order and scale the data, directly into the output
+        self.data_array = np.empty(nsamples, self.dtype)
+        out = self.data_array.view(self.real_dtype).reshape(-1, 2)
+        np.multiply(qi[:, 1], self.scale, out=out[:, 0])
+        np.multiply(qi[:, 0], self.scale, out=out[:, 1])
         # todo: correction data block
 
     # def read_iq(self, nframes=10, lframes=1024, sframes=1):
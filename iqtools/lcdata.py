@@ -11,9 +11,13 @@ an old code by M. Hausmann from 1992
 import numpy as np
 import struct
 import datetime
+import time
 import os
 from iqtools.iqbase import IQBase
 
+# the header is in the first few hundred bytes, 11 bytes of prefix plus the WAVEDESC block
+HEADER_PREFIX_SIZE = 512
+
 
 class LCData(IQBase):
     def __init__(self, filename):
@@ -25,23 +29,23 @@ class LCData(IQBase):
 
         # Additional fields in this subclass
         self.date_time = time.ctime(os.path.getctime(self.filename))
+        self.hdr_len = 0
+        self.vert_gain = 1.0
+        self.vert_offset = 0.0
+        self.raw_memmap = None
+
+        self.read_header()
 
     def read(self, nframes=10, lframes=1024, sframes=0):
         self.read_samples(nframes * lframes, offset=sframes * lframes)
 
-    def read_samples(self, nsamples, offset=0):
-        # TODO:
-        pass
-
-    def read_complete_file(self):
+    def read_header(self):
         """
-        Read a complete LeCroy file
+        Parse the header from a small prefix of the file only
         :return:
         """
-
-        filesize = os.path.getsize(self.filename)
         with open(self.filename, 'rb') as f:
-            file_data = f.read()
+            file_data = f.read(HEADER_PREFIX_SIZE)
         # 45th byte determines the endianness
         # one = little endian
         biglit = ''
@@ -50,7 +54,7 @@ class LCData(IQBase):
         else:
             biglit = '>'
 
-        hdr_len = struct.unpack_from(
+        self.hdr_len = struct.unpack_from(
             '{}I'.format(biglit), file_data, 47)[0] + 11
         self.nsamples_total = struct.unpack_from(
             '{}I'.format(biglit), file_data, 71)[0]
@@ -77,8 +81,35 @@ class LCData(IQBase):
         except ValueError:
             self.date_time = ''
 
-        self.data_array = np.frombuffer(
-            file_data, np.int8, offset=hdr_len) * self.vert_gain
+    def get_raw_memmap(self):
+        """
+        Memory map the int8 waveform right after the header, nothing is read at this point.
+        """
+        if self.raw_memmap is None:
+            n_available = os.path.getsize(self.filename) - self.hdr_len
+            self.raw_memmap = np.memmap(self.filename, dtype=np.int8, mode='r', offset=self.hdr_len,
+                                        shape=(min(n_available, self.nsamples_total),))
+        return self.raw_memmap
+
+    def read_samples(self, nsamples, offset=0):
+        """
+        Read the requested part of the trace and convert it to Volts, using the vertical gain and offset.
+        """
+        if nsamples > self.nsamples_total - offset:
+            raise ValueError(
+                'Requested number of samples is larger than the available {} samples.'.format(self.nsamples_total))
+
+        raw = self.get_raw_memmap()[offset:offset + nsamples]
+        self.data_array = np.empty(raw.size, dtype=self.real_dtype)
+        np.multiply(raw, self.vert_gain, out=self.data_array)
+        self.data_array -= self.vert_offset
+
+    def read_complete_file(self):
+        """
+        Read a complete LeCroy file
+        :return:
+        """
+        self.read_samples(self.get_raw_memmap().size)
         return self.data_array
 
 
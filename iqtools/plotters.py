@@ -177,67 +177,3 @@ def plot_phase_shift(x, phase):
     axs[0, 1].plot(np.imag(x))
     axs[1, 0].plot(np.real(shift_phase(x, phase)))
     axs[1, 1].plot(np.imag(shift_phase(x, phase)))
-
-
-def get_iq_object(filename, header_filename):
-    """
-    Return suitable object accorting to extension.
-
-    Parameters
-    ----------
-    filename
-
-    Returns
-    -------
-
-    """
-    # Object generation
-    _, file_extension = os.path.splitext(filename)
-
-    iq_data = None
-
-    if file_extension.lower() == '.txt' or file_extension.lower() == '.csv':
-        log.info('This is an ASCII file.')
-        iq_data = CSVData(filename)
-
-    if file_extension.lower() == '.bin':
-        log.info('This is a raw binary file.')
-        iq_data = BINData(filename)
-
-    if file_extension.lower() == '.wav':
-        log.info('This is a wav file.')
-        iq_data = WAVData(filename)
-
-    if file_extension.lower() == '.iqt':
-        log.info('This is an iqt file.')
-        iq_data = IQTData(filename)
-
-    if file_extension.lower() == '.iq':
-        log.info('This is an iq file.')
-        iq_data = IQTData(filename)
-
-    if file_extension.lower() == '.tiq':
-        log.info('This is a tiq file.')
-        iq_data = TIQData(filename)
-
-    if file_extension.lower() == '.tdms':
-        log.info('This is a TDMS file.')
-        iq_data = TDMSData(filename)
-
-    if file_extension.lower() == '.dat':
-        log.info('This is a TCAP file.')
-        if not header_filename:
-            log.info('TCAP files need a text header file as well. Aborting....')
-            return None
-        else:
-            iq_data = TCAPData(filename, header_filename)
-
-    if file_extension.lower() == '.xdat':
-        log.info('This is a XDAT file.')
-        if not header_filename:
-            log.info('XDAT files need a text header file as well. Aborting....')
-            return None
-        else:
-            iq_data = XDATData(filename, header_filename)
-
-    return iq_data
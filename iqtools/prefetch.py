@@ -0,0 +1,157 @@
+"""
+Background prefetching of IQ data chunks
+
+Reads the next chunks of any IQBase subclass on a background thread and copies them into a
+ring of preallocated buffers, so that reading from the disk overlaps with
+the computations on the current chunk.
+"""
+
+import threading
+import queue
+import time
+import logging as log
+import numpy as np
+
+
+class PrefetchReader(object):
+    """
+    Delivers the same chunks as IQBase.iter_chunks, reading up to n_buffers - 1 chunks ahead while the current
+    chunk is being processed. The samples returned by read_samples are copied into a ring of buffers and the
+    frames are views of them.
+
+    Usage:
+
+        reader = PrefetchReader(iq_data, lframes=1024, nframes_per_chunk=100)
+        for frames in reader:
+            ... use frames ...
+        print(reader.get_stats())
+
+    Each chunk is a view into one of the buffers of the ring and stays valid only until the next iteration.
+    The wrapped object must not be used otherwise while iterating.
+    """
+
+    def __init__(self, iq_data, lframes, nframes_per_chunk=100, hop=None, start=0, stop=None, n_buffers=3):
+        if n_buffers < 2:
+            raise ValueError('At least two buffers are needed for prefetching.')
+
+        self.iq_data = iq_data
+        self.lframes = lframes
+        self.nframes_per_chunk = nframes_per_chunk
+        self.hop = hop
+        self.start = start
+        self.stop = stop
+        self.n_buffers = n_buffers
+
+        self.buffers = []
+        self.reset_stats()
+
+    def reset_stats(self):
+        # number of chunks delivered
+        self.n_chunks = 0
+        # how often the consumer found no chunk ready and had to wait for the disk
+        self.n_starved = 0
+        # seconds the consumer waited for data, i.e. I/O bound time
+        self.consumer_wait_time = 0.0
+        # seconds the reader waited for a free buffer, i.e. CPU bound time
+        self.producer_wait_time = 0.0
+        # seconds spent reading and copying chunks
+        self.read_time = 0.0
+
+    def get_stats(self):
+        """
+        Return the buffer starvation statistics. If the consumer waits much longer than the reader,
+        the job is I/O bound, otherwise it is CPU bound.
+        """
+        return {'n_chunks': self.n_chunks,
+                'n_starved': self.n_starved,
+                'starved_fraction': self.n_starved / self.n_chunks if self.n_chunks else 0.0,
+                'consumer_wait_time': self.consumer_wait_time,
+                'producer_wait_time': self.producer_wait_time,
+                'read_time': self.read_time,
+                'io_bound': self.consumer_wait_time > self.producer_wait_time}
+
+    def __iter__(self):
+        self.reset_stats()
+        free = queue.Queue()
+        filled = queue.Queue()
+        stop_event = threading.Event()
+
+        # the buffers are allocated with the first chunk, when the data type is known
+        for i in range(self.n_buffers):
+            free.put(i)
+
+        thread = threading.Thread(target=self.produce, args=(
+            free, filled, stop_event), daemon=True)
+        thread.start()
+
+        try:
+            while True:
+                was_empty = filled.empty()
+                t0 = time.perf_counter()
+                item = filled.get()
+                self.consumer_wait_time += time.perf_counter() - t0
+
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+
+                index, nframes = item
+                self.n_chunks += 1
+                if was_empty:
+                    self.n_starved += 1
+                buffer = self.buffers[index]
+                yield np.lib.stride_tricks.as_strided(buffer, shape=(nframes, self.lframes),
+                                                      strides=(self.get_hop() * buffer.itemsize,
+                                                               buffer.itemsize),
+                                                      writeable=False)
+                free.put(index)
+        finally:
+            stop_event.set()
+            thread.join()
+            log.info('Prefetching finished: {}'.format(self.get_stats()))
+
+    def get_hop(self):
+        return self.hop if self.hop else self.lframes
+
+    def produce(self, free, filled, stop_event):
+        """
+        Background thread: read the chunks, copy them into free buffers and hand them over to the consumer.
+        Like in iter_chunks, each buffer holds the contiguous samples of a chunk, the overlapping samples
+        are copied over from the previous buffer instead of being read again.
+        """
+        try:
+            hop = self.get_hop()
+            prev = None
+            for nframes, begin, end in self.iq_data.get_chunk_bounds(self.lframes, self.nframes_per_chunk,
+                                                                     hop, self.start, self.stop):
+                t0 = time.perf_counter()
+                while True:
+                    if stop_event.is_set():
+                        return
+                    try:
+                        index = free.get(timeout=0.1)
+                        break
+                    except queue.Empty:
+                        pass
+                t1 = time.perf_counter()
+                self.producer_wait_time += t1 - t0
+
+                # the consumer only reads the previous buffer, so it can be used here at the same time
+                keep = max(0, prev[2] - begin) if prev else 0
+                self.iq_data.read_samples(end - begin - keep, begin + keep)
+                if not self.buffers:
+                    self.buffers = [np.empty((self.nframes_per_chunk - 1) * hop + self.lframes,
+                                             dtype=self.iq_data.data_array.dtype)
+                                    for _ in range(self.n_buffers)]
+                buffer = self.buffers[index]
+                if keep:
+                    buffer[:keep] = self.buffers[prev[0]][begin - prev[1]:prev[2] - prev[1]]
+                buffer[keep:end - begin] = self.iq_data.data_array
+                prev = (index, begin, end)
+
+                self.read_time += time.perf_counter() - t1
+                filled.put((index, nframes))
+            filled.put(None)
+        except Exception as e:
+            filled.put(e)
@@ -0,0 +1,150 @@
+"""
+Registry of the supported file formats
+
+Every reader class is registered with the module it lives in, so that
+the module is only imported when a file of that format is opened. Formats
+with a recognisable beginning of the file also register a check of these
+magic bytes, which is preferred over the file extension.
+"""
+
+import os
+import re
+import importlib
+import logging as log
+
+# format name -> dictionary with module, class name, extensions, magic check and requirements
+FORMATS = {}
+# lower case file extension -> format name
+EXTENSIONS = {}
+
+# number of bytes at the beginning of the file which are used for the magic checks
+MAGIC_SIZE = 512
+
+# (absolute path, size, modification time) -> format name
+_detection_cache = {}
+
+
+def register_format(name, module, class_name, extensions=(), needs_header=False, magic=None, required_kwargs=()):
+    """
+    Register a reader class for a file format. Nothing is imported at this point.
+
+    :param name: short name of the format
+    :param module: full name of the module containing the class
+    :param class_name: name of the IQBase subclass
+    :param extensions: file extensions including the dot
+    :param needs_header: if the class needs an additional header file as second argument
+    :param magic: function taking the first bytes of a file, returns True if they belong to this format
+    :param required_kwargs: names of keyword arguments the class can not do without, e.g. fs
+    """
+    FORMATS[name] = {'module': module,
+                     'class_name': class_name,
+                     'extensions': tuple(ext.lower() for ext in extensions),
+                     'needs_header': needs_header,
+                     'magic': magic,
+                     'required_kwargs': tuple(required_kwargs)}
+    for ext in extensions:
+        EXTENSIONS[ext.lower()] = name
+    _detection_cache.clear()
+
+
+def get_format_by_extension(filename):
+    """
+    Return the format name according to the file extension or None.
+    """
+    _, file_extension = os.path.splitext(filename)
+    return EXTENSIONS.get(file_extension.lower())
+
+
+def get_format_by_magic(head):
+    """
+    Return the name of the first format whose magic check accepts the given first bytes of a file, or None.
+    """
+    for name, fmt in FORMATS.items():
+        if fmt['magic'] is not None and fmt['magic'](head):
+            return name
+    return None
+
+
+def detect_format(filename):
+    """
+    Find the format of a file, first from the magic bytes at its beginning, then from its extension.
+    Only the first few bytes are read and the result is cached per path, as long as the file does not change.
+
+    :return: format name or None if the file can not be read or the format is unknown
+    """
+    try:
+        stat = os.stat(filename)
+    except OSError as e:
+        log.error('Can not access {}: {}'.format(filename, e))
+        return None
+
+    key = (os.path.abspath(filename), stat.st_size, stat.st_mtime_ns)
+    if key in _detection_cache:
+        return _detection_cache[key]
+
+    try:
+        with open(filename, 'rb') as f:
+            head = f.read(MAGIC_SIZE)
+    except OSError as e:
+        log.error('Can not read {}: {}'.format(filename, e))
+        return None
+
+    name = get_format_by_magic(head) or get_format_by_extension(filename)
+    _detection_cache[key] = name
+    return name
+
+
+def get_iq_class(name):
+    """
+    Import the module of the format only now and return its class.
+    """
+    fmt = FORMATS[name]
+    module = importlib.import_module(fmt['module'])
+    return getattr(module, fmt['class_name'])
+
+
+# ------------ MAGIC CHECKS ----------------------------
+
+def is_tdms(head):
+    return head[:4] == b'TDSm'
+
+
+def is_wav(head):
+    return head[:4] == b'RIFF' and head[8:12] == b'WAVE'
+
+
+def is_lecroy(head):
+    return b'WAVEDESC' in head[:64]
+
+
+def is_tiq(head):
+    # XML header whose first line has the data offset as the first quoted value
+    first_line = head.split(b'\n', 1)[0]
+    return head[:1] == b'<' and re.match(rb'^<[^"]*"\d+"', first_line) is not None
+
+
+def is_iqt(head):
+    # one digit, telling how many digits the header length has, then the header length itself
+    if not head[:1].isdigit():
+        return False
+    n = int(head[:1])
+    return 0 < n < 10 and head[1:1 + n].isdigit() and b'=' in head[1 + n:]
+
+
+register_format('csv', 'iqtools.csvdata', 'CSVData', ('.txt', '.csv'))
+register_format('bin', 'iqtools.bindata', 'BINData', ('.bin',))
+register_format('wav', 'iqtools.wavdata', 'WAVData', ('.wav',), magic=is_wav)
+register_format('iqt', 'iqtools.iqtdata', 'IQTData',
+                ('.iqt', '.iq'), magic=is_iqt)
+register_format('tiq', 'iqtools.tiqdata', 'TIQData', ('.tiq',), magic=is_tiq)
+register_format('tdms', 'iqtools.tdmsdata', 'TDMSData',
+                ('.tdms',), magic=is_tdms)
+register_format('tcap', 'iqtools.tcapdata', 'TCAPData',
+                ('.dat',), needs_header=True)
+register_format('xdat', 'iqtools.xdatdata', 'XDATData',
+                ('.xdat',), needs_header=True)
+register_format('lecroy', 'iqtools.lcdata', 'LCData',
+                ('.trc', '.lc'), magic=is_lecroy)
+register_format('gnuradio', 'iqtools.grdata', 'GRData',
+                ('.cfile', '.gr'), required_kwargs=('fs',))
+register_format('iqc', 'iqtools.iqcdata', 'IQCData', ('.iqc',))
@@ -35,14 +35,30 @@ e.g. a 2-block frame would correspond to 2.12s data.
 """
 
 import datetime
+import glob
 import os
 import struct
 import logging as log
 import numpy as np
 from iqtools.iqbase import IQBase
 
+BLOCK_HEADER_SIZE = 88
+BLOCK_DATA_SIZE = 2 ** 17
+BLOCK_SIZE = BLOCK_HEADER_SIZE + BLOCK_DATA_SIZE
+# 4 bytes per sample, 2 I + 2 Q bytes
+BLOCK_NSAMPLES = BLOCK_DATA_SIZE // 4
+SEGMENT_BLOCKS = 15625
+
+# one block on disk: TFP time stamp, PIO, scalers and the big endian 16 bit I and Q payload
+BLOCK_TYPE = np.dtype([('tfp', np.uint8, (12,)),
+                       ('pio', np.uint8, (12,)),
+                       ('scalers', np.uint8, (64,)),
+                       ('data', '>i2', (2 * BLOCK_NSAMPLES,))])
+
 
 class TCAPData(IQBase):
+    constant_int16_scale = True
+
     def __init__(self, filename, header_filename):
         super().__init__(filename)
 
@@ -54,6 +70,7 @@ class TCAPData(IQBase):
         # Additional fields in this subclass
         self.tcap_scalers = None
         self.tcap_pio = None
+        self.tcap_tfp = None
 
         self.version = ''
         self.adc_range = 0
@@ -68,110 +85,149 @@ class TCAPData(IQBase):
         # center is usually fixed to 1.6e5
 
         self.read_header()
+        self.set_segments([filename])
 
     def read(self, nframes=10, lframes=1024, sframes=0):
         self.read_samples(nframes * lframes, offset=sframes * lframes)
 
-    def read_samples(self, nsamples, offset=0):
+    def set_segments(self, filenames):
         """
-        Read TCAP files *.dat
+        Define the sequential segment files which make up the recording. A single file is one segment.
+        Each segment is memory mapped as an array of blocks, each block consisting of its header and its data.
         """
+        self.segment_filenames = list(filenames)
+        self.blocks_memmaps = []
+        for filename in self.segment_filenames:
+            filesize = os.path.getsize(filename)
+            # each file contains 15625 blocks
+            if not filesize == SEGMENT_BLOCKS * BLOCK_SIZE:
+                log.info(
+                    'Size of {} does not match block sizes times total number of blocks. Using {} complete blocks.'.format(
+                        filename, filesize // BLOCK_SIZE))
+            self.blocks_memmaps.append(np.memmap(
+                filename, dtype=BLOCK_TYPE, mode='r', shape=(filesize // BLOCK_SIZE,)))
+
+        # global block number where each segment begins, the last entry is the total number of blocks
+        self.segment_first_block = np.concatenate(
+            ([0], np.cumsum([m.shape[0] for m in self.blocks_memmaps])))
+        self.n_blocks = int(self.segment_first_block[-1])
+        self.nsamples_total = self.n_blocks * BLOCK_NSAMPLES
+
+    def get_blocks_memmap(self, segment=0):
+        """
+        Return the memory mapped blocks of one segment file.
+        """
+        return self.blocks_memmaps[segment]
 
-        BLOCK_HEADER_SIZE = 88
-        BLOCK_DATA_SIZE = 2 ** 17
-        BLOCK_SIZE = BLOCK_HEADER_SIZE + BLOCK_DATA_SIZE
-
-        filesize = os.path.getsize(self.filename)
-        # each file contains 15625 blocks
-        if not filesize == 15625 * BLOCK_SIZE:
-            log.info(
-                "File size does not match block sizes times total number of blocks. Aborting...")
-            return
-
-        # read header section
-        with open(self.filename, 'rb') as f:
-            tfp = f.read(12)
-            pio = f.read(12)
-            scalers = f.read(64)
-
-        self.date_time = self.parse_tcap_tfp(tfp)
-        self.tcap_pio = pio
-        self.tcap_scalers = scalers
-
-        data_section_size = self.frame_size - BLOCK_HEADER_SIZE
-        n_iq_samples = data_section_size / 2 / 2  # two bytes for I and two bytes for Q
-        self.nsamples_total = self.segment_blocks * n_iq_samples
-
-        # 4 comes from 2 times 2 byte integer for I and Q
-        total_n_bytes = 4 * nsamples
-        start_n_bytes = 4 * offset
-
-        ba = bytearray()
-        try:
-            with open(self.filename, 'rb') as f:
-                f.seek(BLOCK_HEADER_SIZE + start_n_bytes)
-                for i in range(total_n_bytes):
-                    if not f.tell() % BLOCK_SIZE:
-                        log.info(
-                            'File pointer before jump: {}'.format(f.tell()))
-                        log.info(
-                            "Reached end of block {}. Now skipoing header of block {}!".format(
-                                int(f.tell() / BLOCK_SIZE),
-                                int(
-                                    f.tell() / BLOCK_SIZE) + 1))
-                        f.seek(88, 1)
-                        log.info('File pointer after jump: {}'.format(f.tell()))
-                    # using bytearray.extend is much faster than using +=
-                    ba.extend(f.read(1))
-        except:
-            log.error('File seems to end here!')
-            return
-
-        log.info('Total bytes read: {}'.format(len(ba)))
+    def read_samples(self, nsamples, offset=0):
+        """
+        Read TCAP files *.dat
 
-        # big endian 16 bit for I and 16 bit for Q
-        self.data_array = np.frombuffer(ba, '>i2')
-        self.data_array = self.data_array.astype(np.float32)
-        self.data_array = self.data_array * self.scale
-        self.data_array = self.data_array.view(np.complex64)
+        Only the blocks covering the requested samples are touched, also across segment file boundaries.
+        The per block TFP time stamps, PIO and scalers of these blocks are stored in tcap_tfp, tcap_pio
+        and tcap_scalers, one row per block.
+        """
+        if nsamples > self.nsamples_total - offset:
+            raise ValueError(
+                'Requested number of samples is larger than the available {} samples.'.format(self.nsamples_total))
+
+        self.date_time = self.parse_tcap_tfp(
+            self.get_blocks_memmap(0)['tfp'][0])
+
+        first_block = offset // BLOCK_NSAMPLES
+        last_block = (offset + nsamples - 1) // BLOCK_NSAMPLES + 1
+
+        self.data_array = np.empty(nsamples, dtype=self.dtype)
+        out = self.data_array.view(self.real_dtype)
+        tfp, pio, scalers = [], [], []
+
+        first_segment = np.searchsorted(
+            self.segment_first_block, first_block, side='right') - 1
+        last_segment = np.searchsorted(
+            self.segment_first_block, last_block, side='left')
+        for segment in range(first_segment, last_segment):
+            blocks = self.get_blocks_memmap(segment)
+            seg_first_block = self.segment_first_block[segment]
+            # blocks of this segment needed for the request, in segment local numbers
+            b0 = max(first_block, seg_first_block) - seg_first_block
+            b1 = min(last_block, self.segment_first_block[segment + 1]) - seg_first_block
+
+            tfp.append(blocks['tfp'][b0:b1])
+            pio.append(blocks['pio'][b0:b1])
+            scalers.append(blocks['scalers'][b0:b1])
+
+            # global sample range served by this segment
+            lo = max(offset, (seg_first_block + b0) * BLOCK_NSAMPLES)
+            hi = min(offset + nsamples, (seg_first_block + b1) * BLOCK_NSAMPLES)
+            start = lo - (seg_first_block + b0) * BLOCK_NSAMPLES
+
+            # skip the block headers by taking only the payload of the blocks, then cut the requested samples
+            iq = blocks['data'][b0:b1].reshape(-1)
+            iq = iq[2 * start:2 * (start + hi - lo)]
+            log.info('Bytes read from {}: {}'.format(
+                self.segment_filenames[segment], iq.nbytes))
+
+            # big endian 16 bit for I and 16 bit for Q, scaled directly into the output
+            np.multiply(iq, self.scale,
+                        out=out[2 * (lo - offset):2 * (hi - offset)])
+
+        self.tcap_tfp = np.concatenate(tfp)
+        self.tcap_pio = np.concatenate(pio)
+        self.tcap_scalers = np.concatenate(scalers)
 
     def read_block(self, block_no):
         """
-        Read the specified block between 1 and 15625.
+        Read the specified block, counting from 1. In a single file that is between 1 and 15625.
         """
-        BLOCK_HEADER_SIZE = 88
-        BLOCK_DATA_SIZE = 2 ** 17
-        BLOCK_SIZE = BLOCK_HEADER_SIZE + BLOCK_DATA_SIZE
-
-        try:
-            with open(self.filename, 'rb') as f:
-                f.seek((block_no - 1) * BLOCK_SIZE)
-                tfp = f.read(12)
-                pio = f.read(12)
-                scalers = f.read(64)
-                ba = f.read(131072)
-        except:
+        if not 1 <= block_no <= self.n_blocks:
             log.error('File seems to end here!')
             return
 
-        self.date_time = self.parse_tcap_tfp(tfp)
-        self.tcap_pio = pio
-        self.tcap_scalers = scalers
+        segment = np.searchsorted(
+            self.segment_first_block, block_no - 1, side='right') - 1
+        block = self.get_blocks_memmap(
+            segment)[block_no - 1 - self.segment_first_block[segment]]
 
-        log.info('Total bytes read: {}'.format(len(ba)))
+        self.date_time = self.parse_tcap_tfp(block['tfp'])
+        self.tcap_tfp = block['tfp']
+        self.tcap_pio = block['pio']
+        self.tcap_scalers = block['scalers']
+
+        log.info('Total bytes read: {}'.format(block['data'].nbytes))
 
         # big endian 16 bit for I and 16 bit for Q
-        self.data_array = np.frombuffer(ba, '>i2')
-        self.data_array = self.data_array.astype(np.float32)
-        self.data_array = self.data_array * self.scale
-        self.data_array = self.data_array.view(np.complex64)
+        self.data_array = np.empty(BLOCK_NSAMPLES, dtype=self.dtype)
+        np.multiply(block['data'], self.scale,
+                    out=self.data_array.view(self.real_dtype))
         return self.data_array
 
+    def get_block_times(self, tfp=None):
+        """
+        Decode the BCD coded TFP time stamps of many blocks at once, see parse_tcap_tfp for the layout.
+
+        :param tfp: array of shape (n, 12) with the raw TFP bytes, by default the blocks of the last read
+        :return: numpy datetime64 array with microsecond resolution, one entry per block
+        """
+        if tfp is None:
+            tfp = self.tcap_tfp
+        tfp = np.atleast_2d(np.asarray(tfp, dtype=np.int64))
+        hi = (tfp >> 4) & 0x0f
+        lo = tfp & 0x0f
+
+        days = lo[:, 3] * 100 + hi[:, 4] * 10 + lo[:, 4]
+        seconds = (hi[:, 5] * 10 + lo[:, 5]) * 3600 + \
+            (hi[:, 6] * 10 + lo[:, 6]) * 60 + hi[:, 7] * 10 + lo[:, 7]
+        microseconds = hi[:, 8] * 100000 + lo[:, 8] * 10000 + hi[:, 9] * 1000 + \
+            lo[:, 9] * 100 + hi[:, 10] * 10 + lo[:, 10]
+
+        year_start = np.datetime64('{}-01-01'.format(self.file_basename[0:4]), 'us')
+        return year_start + (days - 1).astype('m8[D]') + seconds.astype('m8[s]') + microseconds.astype('m8[us]')
+
     def get_frame(self, first, second):
         """
         Make a frame by connecting two blocks
         """
-        array = np.zeros(2 * 32768, dtype=np.complex64)
+        array = np.zeros(2 * 32768, dtype=self.dtype)
         array[0:32768] = self.read_block(first)
         array[32768:] = self.read_block(second)
         return array
@@ -268,3 +324,23 @@ class TCAPData(IQBase):
         self.trigger_time = float(dic['trigger_time'])
         self.segment_blocks = int(dic['segment_blocks'])
         return dic
+
+
+class TCAPMultiData(TCAPData):
+    """
+    A TCAP recording spread over sequential segment files of 2 GB each, presented with
+    one continuous sample index. Reads crossing a file boundary are served from both files.
+    """
+
+    def __init__(self, filenames, header_filename):
+        """
+        :param filenames: ordered list of segment files or a glob pattern, which is sorted by name
+        :param header_filename: the TCAP text header file
+        """
+        if isinstance(filenames, str):
+            filenames = sorted(glob.glob(filenames))
+        if not filenames:
+            raise ValueError('No TCAP segment files were found.')
+
+        super().__init__(filenames[0], header_filename)
+        self.set_segments(filenames)
@@ -7,11 +7,34 @@ Xaratustrah Aug-2015
 """
 
 import os
+import json
+import struct
 import time
 import logging as log
 import numpy as np
 from iqtools.iqbase import IQBase
-import pytdms
+
+# segment lead-in: tag, ToC mask, version, next segment offset and raw data offset
+TDMS_LEADIN = struct.Struct('<4sIIQQ')
+TOC_META_DATA = 1 << 1
+TOC_NEW_OBJ_LIST = 1 << 2
+TOC_RAW_DATA = 1 << 3
+TOC_INTERLEAVED_DATA = 1 << 5
+TOC_BIG_ENDIAN = 1 << 6
+TOC_DAQMX_RAW_DATA = 1 << 7
+
+# struct formats of the fixed size TDMS data types
+TDMS_TYPES = {0x01: 'b', 0x02: 'h', 0x03: 'i', 0x04: 'q', 0x05: 'B', 0x06: 'H', 0x07: 'I', 0x08: 'Q',
+              0x09: 'f', 0x0A: 'd', 0x19: 'f', 0x1A: 'd', 0x21: '?', 0x44: 'Qq',
+              0x08000c: 'ff', 0x10000d: 'dd'}
+TDMS_TYPE_I16 = 0x02
+TDMS_TYPE_STRING = 0x20
+
+I_CHANNEL = "/'RecordData'/'I'"
+Q_CHANNEL = "/'RecordData'/'Q'"
+GAIN_CHANNEL = "/'RecordHeader'/'gain'"
+
+INDEX_VERSION = 1
 
 
 class TDMSData(IQBase):
@@ -19,23 +42,25 @@ class TDMSData(IQBase):
         super().__init__(filename)
 
         # Additional fields in this subclass
-        self.tdms_first_rec_size = 0
-        self.tdms_other_rec_size = 0
         self.tdms_nSamplesPerRecord = 0
         self.tdms_nRecordsPerFile = 0
+        self.tdms_index = None
+        self.file_memmap = None
         self.information_read = False
 
         self.rf_att = 0.0
         self.date_time = ''
 
+        self.read_tdms_information()
+
     def read(self, nframes=10, lframes=1024, sframes=0):
         self.read_samples(nframes * lframes, offset=sframes * lframes)
 
     def read_samples(self, nsamples, offset=0):
         """
-        Read from TDMS Files: Check the amount needed corresponds to how many records. Then read those records only
-        and from them return only the desired amount. This way the memory footprint is smallest passible and it is
-        also fast.
+        Read from TDMS Files: Look up the records covering the requested samples in the index, then decode
+        only these samples from the memory mapped file. The 16 bit I and Q values are scaled with the gain
+        of their record and written directly into a preallocated interleaved complex output array.
         """
 
         if not self.information_read:
@@ -45,74 +70,38 @@ class TDMSData(IQBase):
             raise ValueError(
                 'Requested number of samples is larger than the available {} samples.'.format(self.nsamples_total))
 
-        # let's see this amount corresponds to which start record
-        # start at the beginning of
-        start_record = int(offset / self.tdms_nSamplesPerRecord) + 1
-        starting_sample_within_start_record = offset % self.tdms_nSamplesPerRecord
+        idx = self.tdms_index
+        record_start = idx['record_start']
+        # let's see this amount corresponds to which records
+        first_record = np.searchsorted(record_start, offset, side='right') - 1
+        last_record = np.searchsorted(
+            record_start, offset + nsamples, side='left')
 
-        # See how many records should we read, considering also the half-way started record?
-        n_records = int((starting_sample_within_start_record +
-                         nsamples) / self.tdms_nSamplesPerRecord) + 1
+        iq_type = np.dtype(idx['byte_order'] + 'i2')
+        mm = self.get_memmap()
+
+        self.data_array = np.empty(nsamples, dtype=self.dtype)
+        out = self.data_array.view(self.real_dtype)
+        for record in range(first_record, last_record):
+            lo = max(offset, record_start[record])
+            hi = min(offset + nsamples, record_start[record + 1])
+            within = lo - record_start[record]
+            gain = idx['gain'][record]
 
-        # that would be too much
-        if start_record + n_records > self.tdms_nRecordsPerFile:
-            raise ValueError(
-                'Requested number of samples requires {} records, which is larger than the available {} records in this file.'.format(start_record + n_records, self.tdms_nRecordsPerFile))
-
-        # instead of real file size find out where to stop
-        absolute_size = self.tdms_first_rec_size + \
-            (start_record + n_records - 2) * self.tdms_other_rec_size
-
-        # We start with empty data
-        objects = {}
-        raw_data = {}
-
-        f = open(self.filename, "rb")  # Open in binary mode for portability
-
-        # While there's still something left to read
-        while f.tell() < absolute_size:
-            # loop until first record is filled up
-            # we always need to read the first record.
-            # don't jump if start record is 1, just go on reading
-            if start_record > 1 and f.tell() == self.tdms_first_rec_size:
-                # reached the end of first record, now do the jump
-                f.seek(f.tell() + (start_record - 2)
-                       * self.tdms_other_rec_size)
-            if f.tell() == self.tdms_first_rec_size:
-                log.info('Reached end of first record.')
-            # Now we read record by record
             try:
-                objects, raw_data = pytdms.readSegment(
-                    f, absolute_size, (objects, raw_data))
-            except:
+                ii = np.frombuffer(mm, dtype=iq_type, count=hi - lo,
+                                   offset=idx['i_offset'][record] + 2 * within)
+                qq = np.frombuffer(mm, dtype=iq_type, count=hi - lo,
+                                   offset=idx['q_offset'][record] + 2 * within)
+            except ValueError:
                 log.error('File seems to end here!')
                 return
-        # ok, now close the file
-        f.close()
-
-        # up to now, we have read only the amount of needed records times number of samples per record
-        # this is of course more than what we actually need.
-
-        # convert array.array to np.array
-        ii = np.frombuffer(raw_data[b"/'RecordData'/'I'"], dtype=np.int16)
-        qq = np.frombuffer(raw_data[b"/'RecordData'/'Q'"], dtype=np.int16)
-
-        # get rid of duplicates at the beginning if start record is larger than one
-        if start_record > 1:
-            ii = ii[self.tdms_nSamplesPerRecord:]
-            qq = qq[self.tdms_nSamplesPerRecord:]
-
-        ii = ii[starting_sample_within_start_record:starting_sample_within_start_record + nsamples]
-        qq = qq[starting_sample_within_start_record:starting_sample_within_start_record + nsamples]
-
-        # Vectorized is slow, so do interleaved copy instead
-        self.data_array = np.zeros(2 * nsamples, dtype=np.float32)
-        self.data_array[::2], self.data_array[1::2] = ii, qq
-        self.data_array = self.data_array.view(np.complex64)
-        gain = np.frombuffer(
-            raw_data[b"/'RecordHeader'/'gain'"], dtype=np.float64)
-        self.scale = gain[0]
-        self.data_array = self.data_array * self.scale
+
+            # scale and interleave in one go, straight into the output
+            np.multiply(ii, gain, out=out[2 * (lo - offset):2 * (hi - offset):2])
+            np.multiply(qq, gain, out=out[2 * (lo - offset) + 1:2 * (hi - offset):2])
+
+        self.scale = idx['gain'][first_record]
         log.info("TDMS Read finished.")
 
     def read_complete_file(self):
@@ -124,72 +113,208 @@ class TDMSData(IQBase):
         if not self.information_read:
             self.read_tdms_information()
 
-        objects, raw_data = pytdms.read(self.filename)
-
-        # convert array.array to np.array
-        ii = np.frombuffer(raw_data[b"/'RecordData'/'I'"], dtype=np.int16)
-        qq = np.frombuffer(raw_data[b"/'RecordData'/'Q'"], dtype=np.int16)
+        self.read_samples(self.nsamples_total, 0)
 
-        # Vectorized is slow, so do interleaved copy instead
-
-        len = np.shape(ii)[0]
-        self.data_array = np.zeros(2 * len, dtype=np.float32)
-        self.data_array[::2], self.data_array[1::2] = ii, qq
-        self.data_array = self.data_array.view(np.complex64)
-        gain = np.frombuffer(
-            raw_data[b"/'RecordHeader'/'gain'"], dtype=np.float64)
-        self.scale = gain[0]
-        self.data_array = self.data_array * self.scale
-        log.info("TDMS Read finished.")
+    def get_memmap(self):
+        """
+        Memory map the whole file as bytes, the records are then decoded using the offsets in the index.
+        """
+        if self.file_memmap is None:
+            self.file_memmap = np.memmap(self.filename, dtype=np.uint8, mode='r')
+        return self.file_memmap
 
     def read_tdms_information(self):
         """
-        Performs one read on the file in order to get the values
+        Get the values from the record index, which is loaded from its sidecar file or built once by scanning the file.
         """
+        if not self.load_index():
+            self.build_index()
+            self.save_index()
 
-        # Usually size matters, but not in this case! because we only read 2 records, but anyway should be large enough.
-        sz = os.path.getsize(self.filename)
-        how_many = 0
-        last_i_ff = 0
-        last_q_ff = 0
-        # We start with empty data
-        objects = {}
-        raw_data = {}
-
-        # Read just 2 records in order to estimate the record sizes
-        f = open(self.filename, "rb")
-        while f.tell() < sz:
-            try:
-                objects, raw_data = pytdms.readSegment(
-                    f, sz, (objects, raw_data))
-            except:
-                log.error('TDMS file seems to end here!')
-                return
+        properties = json.loads(str(self.tdms_index['properties']))
+        root = properties.get('/', {})
 
-            if b"/'RecordData'/'I'" in raw_data and b"/'RecordData'/'Q'" in raw_data:
-                # This record has both I and Q
-                last_i = raw_data[b"/'RecordData'/'I'"][-1]
-                last_q = raw_data[b"/'RecordData'/'Q'"][-1]
-                offset = f.tell()
-
-                if last_i_ff != last_i and last_q_ff != last_q:
-                    how_many += 1
-                    last_i_ff = last_i
-                    last_q_ff = last_q
-                    if how_many == 1:
-                        self.tdms_first_rec_size = offset
-                    if how_many == 2:
-                        self.tdms_other_rec_size = offset - self.tdms_first_rec_size
-                        break
-
-        self.fs = float(objects[b'/'][3][b'IQRate'][1])
-        self.rf_att = float(objects[b'/'][3][b'RFAttentuation'][1])
-        self.center = float(objects[b'/'][3][b'IQCarrierFrequency'][1])
+        self.fs = float(root['IQRate'])
+        self.rf_att = float(root['RFAttentuation'])
+        self.center = float(root['IQCarrierFrequency'])
         self.date_time = time.ctime(os.path.getctime(self.filename))
-        self.tdms_nSamplesPerRecord = int(
-            objects[b'/'][3][b'NSamplesPerRecord'][1])
-        self.tdms_nRecordsPerFile = int(
-            objects[b'/'][3][b'NRecordsPerFile'][1])
-        self.nsamples_total = self.tdms_nSamplesPerRecord * self.tdms_nRecordsPerFile
+        self.tdms_nSamplesPerRecord = int(root['NSamplesPerRecord'])
+        self.tdms_nRecordsPerFile = int(root['NRecordsPerFile'])
+        self.nsamples_total = int(self.tdms_index['record_start'][-1])
 
         self.information_read = True
+
+    def get_index_filename(self):
+        return self.filename + '.idx.npz'
+
+    def build_index(self):
+        """
+        Scan the lead-in and meta data of all segments once, without reading the raw data. For every record,
+        i.e. every raw data chunk that contains I and Q, the byte offsets of the segment and of the I and Q values,
+        the number of samples and the gain valid for that record are collected.
+        """
+        filesize = os.path.getsize(self.filename)
+        properties = {}
+        # object path -> (data type, number of values) from the last raw data index of that object
+        layouts = {}
+        # objects with raw data in the current segment, in the order of the raw data
+        active = []
+
+        segment_offset, i_offset, q_offset, n_samples, gains = [], [], [], [], []
+        gain = 1.0
+        byte_order = '<'
+
+        with open(self.filename, 'rb') as f:
+            segment_start = 0
+            while segment_start + TDMS_LEADIN.size <= filesize:
+                f.seek(segment_start)
+                tag, toc, _, next_offset, raw_offset = TDMS_LEADIN.unpack(
+                    f.read(TDMS_LEADIN.size))
+                if tag != b'TDSm':
+                    log.error('TDMS file seems to end here!')
+                    break
+
+                endian = '>' if toc & TOC_BIG_ENDIAN else '<'
+                data_start = segment_start + TDMS_LEADIN.size + raw_offset
+                # an unfinished last segment has all bits of the next segment offset set
+                if next_offset == 0xFFFFFFFFFFFFFFFF:
+                    segment_end = filesize
+                else:
+                    segment_end = min(
+                        filesize, segment_start + TDMS_LEADIN.size + next_offset)
+
+                if toc & TOC_META_DATA:
+                    if toc & TOC_NEW_OBJ_LIST:
+                        active = []
+                    read_tdms_metadata(f, endian, properties, layouts, active)
+
+                if toc & TOC_RAW_DATA and active:
+                    if toc & (TOC_INTERLEAVED_DATA | TOC_DAQMX_RAW_DATA):
+                        raise ValueError(
+                            'Interleaved or DAQmx raw data in TDMS files are not supported.')
+                    try:
+                        formats = [endian + TDMS_TYPES[layouts[path][0]]
+                                   for path in active]
+                    except KeyError:
+                        raise ValueError(
+                            'Only fixed size data types are supported in TDMS raw data.')
+                    sizes = [struct.calcsize(fmt) * layouts[path][1]
+                             for fmt, path in zip(formats, active)]
+                    chunk_size = sum(sizes)
+
+                    n_chunks = (segment_end - data_start) // chunk_size if chunk_size else 0
+                    for chunk in range(n_chunks):
+                        positions = {}
+                        pos = data_start + chunk * chunk_size
+                        for path, size in zip(active, sizes):
+                            positions[path] = pos
+                            pos += size
+
+                        if GAIN_CHANNEL in positions and layouts[GAIN_CHANNEL][1]:
+                            fmt = formats[active.index(GAIN_CHANNEL)]
+                            f.seek(positions[GAIN_CHANNEL])
+                            gain = struct.unpack(
+                                fmt, f.read(struct.calcsize(fmt)))[0]
+
+                        if I_CHANNEL in positions and Q_CHANNEL in positions:
+                            if layouts[I_CHANNEL][0] != TDMS_TYPE_I16 or layouts[Q_CHANNEL][0] != TDMS_TYPE_I16:
+                                raise ValueError(
+                                    'TDMS record data are expected as 16 bit integers.')
+                            segment_offset.append(segment_start)
+                            i_offset.append(positions[I_CHANNEL])
+                            q_offset.append(positions[Q_CHANNEL])
+                            n_samples.append(
+                                min(layouts[I_CHANNEL][1], layouts[Q_CHANNEL][1]))
+                            gains.append(gain)
+                            byte_order = endian
+
+                segment_start = segment_end
+
+        self.tdms_index = {'version': INDEX_VERSION,
+                           'file_size': filesize,
+                           'file_mtime': os.path.getmtime(self.filename),
+                           'byte_order': byte_order,
+                           'properties': json.dumps(properties, default=str),
+                           'segment_offset': np.array(segment_offset, dtype=np.int64),
+                           'i_offset': np.array(i_offset, dtype=np.int64),
+                           'q_offset': np.array(q_offset, dtype=np.int64),
+                           'gain': np.array(gains, dtype=np.float64),
+                           # first sample of every record, the last entry is the total number of samples
+                           'record_start': np.concatenate(([0], np.cumsum(n_samples, dtype=np.int64)))}
+        log.info('Indexed {} TDMS records.'.format(len(n_samples)))
+
+    def save_index(self):
+        """
+        Persist the record index next to the data file, so that later opens do not need to scan again.
+        """
+        try:
+            with open(self.get_index_filename(), 'wb') as f:
+                np.savez(f, **self.tdms_index)
+        except OSError as e:
+            log.warning('Could not save TDMS index: {}'.format(e))
+
+    def load_index(self):
+        """
+        Load the record index from the sidecar file, if it exists and still belongs to the data file.
+        :return: True if the index could be used
+        """
+        try:
+            with np.load(self.get_index_filename()) as npz:
+                index = {key: npz[key] for key in npz.files}
+        except (OSError, ValueError):
+            return False
+
+        if int(index['version']) != INDEX_VERSION or \
+                int(index['file_size']) != os.path.getsize(self.filename) or \
+                float(index['file_mtime']) != os.path.getmtime(self.filename):
+            log.info('TDMS index is outdated.')
+            return False
+
+        index['byte_order'] = str(index['byte_order'])
+        self.tdms_index = index
+        return True
+
+
+def read_tdms_string(f, endian):
+    length = struct.unpack(endian + 'I', f.read(4))[0]
+    return f.read(length).decode('utf-8', errors='replace')
+
+
+def read_tdms_metadata(f, endian, properties, layouts, active):
+    """
+    Parse the meta data of one segment and update the properties, the raw data layouts and
+    the list of objects with raw data in this segment.
+    """
+    n_objects = struct.unpack(endian + 'I', f.read(4))[0]
+    for _ in range(n_objects):
+        path = read_tdms_string(f, endian)
+        index_length = struct.unpack(endian + 'I', f.read(4))[0]
+        if index_length == 0xFFFFFFFF:
+            # no raw data for this object in this segment
+            if path in active:
+                active.remove(path)
+        else:
+            # zero means the raw data index of the previous segment is reused
+            if index_length != 0:
+                type_code, _, n_values = struct.unpack(
+                    endian + 'IIQ', f.read(16))
+                # skip the total size of strings and anything else we do not need
+                f.seek(index_length - 20, 1)
+                layouts[path] = (type_code, n_values)
+            if path not in active:
+                active.append(path)
+
+        props = properties.setdefault(path, {})
+        n_props = struct.unpack(endian + 'I', f.read(4))[0]
+        for _ in range(n_props):
+            name = read_tdms_string(f, endian)
+            type_code = struct.unpack(endian + 'I', f.read(4))[0]
+            if type_code == TDMS_TYPE_STRING:
+                props[name] = read_tdms_string(f, endian)
+            else:
+                if type_code not in TDMS_TYPES:
+                    raise ValueError('Unsupported data type 0x{:x} of TDMS property {} of {}.'.format(
+                        type_code, name, path))
+                fmt = endian + TDMS_TYPES[type_code]
+                value = struct.unpack(fmt, f.read(struct.calcsize(fmt)))
+                props[name] = value[0] if len(value) == 1 else value
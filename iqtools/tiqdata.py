@@ -25,6 +25,7 @@ class TIQData(IQBase):
         self.rf_att = 0.0
         self.rbw = 0.0
         self.data_offset = 0
+        self.raw_memmap = None
 
         self.header = ''
         self.read_header()
@@ -49,30 +50,47 @@ class TIQData(IQBase):
             raise ValueError(
                 'Requested number of samples is larger than the available {} samples.'.format(self.nsamples_total))
 
-        total_n_bytes = 8 * nsamples  # 8 comes from 2 times 4 byte integer for I and Q
-        start_n_bytes = 8 * offset
-
-        # file might have the correcct size, but the data not copied fully
-        try:
-            with open(self.filename, 'rb') as f:
-                f.seek(self.data_offset + start_n_bytes)
-                ba = f.read(total_n_bytes)
-        except:
+        # only the requested slice of the memory map is touched, everything else stays on disk
+        raw = self.get_raw_view(nsamples, offset)
+        if raw.shape[0] < nsamples:
             log.error('File seems to end here!')
             return
 
-        # return a numpy array of little endian 8 byte floats (known as doubles)
-        # little endian 4 byte ints.
-        self.data_array = np.fromstring(ba, dtype='<i4')
-        # Scale to retrieve value in Volts. Augmented assignment does not work here!
-        self.data_array = self.data_array * self.scale
-        self.data_array = self.data_array.view(
-            dtype='c16')  # reinterpret the bytes as a 16 byte complex number, which consists of 2 doubles.
+        # Scale to retrieve value in Volts. Scaling creates the only copy, directly into the complex output
+        # array, which is reinterpreted as pairs of floats for I and Q.
+        self.data_array = np.empty(nsamples, dtype=self.dtype)
+        np.multiply(raw, self.scale,
+                    out=self.data_array.view(self.real_dtype).reshape(-1, 2))
 
         log.info("Output complex array has a size of {}.".format(
             self.data_array.size))
         # in order to read you may use: data = x.item()['data'] or data = x[()]['data'] other wise you get 0-d error
 
+    def get_raw_memmap(self):
+        """
+        Memory map the data section of the file as pairs of little endian 4 byte integers for I and Q.
+        Nothing is read from the disk at this point. The file might have the correct size in the header,
+        but the data not copied fully, so the map is limited to what is actually there.
+        """
+        if self.raw_memmap is None:
+            n_available = (os.path.getsize(self.filename) -
+                           self.data_offset) // 8
+            n_available = max(0, min(n_available, self.nsamples_total))
+            self.raw_memmap = np.memmap(self.filename, dtype='<i4', mode='r',
+                                        offset=self.data_offset, shape=(n_available, 2))
+        return self.raw_memmap
+
+    def get_raw_view(self, nsamples, offset=0):
+        """
+        Return a lazy, unscaled view of the raw int32 I and Q values, with shape (nsamples, 2).
+        No data are copied, the pages are read by the operating system only when the view is used.
+        Multiply with self.scale to get values in Volts.
+        """
+        if nsamples > self.nsamples_total - offset:
+            raise ValueError(
+                'Requested number of samples is larger than the available {} samples.'.format(self.nsamples_total))
+        return self.get_raw_memmap()[offset:offset + nsamples]
+
     def read_header(self):
         """
         Parse TIQ header
@@ -5,91 +5,56 @@ Xaratustrah
 2017
 """
 
-import os
+import struct
 import logging as log
-from scipy.signal import hilbert
-from scipy.io import wavfile
 import xml.etree.ElementTree as et
 import numpy as np
 
 import types
-import uproot3
-import uproot3_methods.classes.TH1
 
 from iqtools.iqbase import IQBase
-from iqtools.tcapdata import TCAPData
-from iqtools.tdmsdata import TDMSData
-from iqtools.bindata import BINData
-from iqtools.iqtdata import IQTData
-from iqtools.tiqdata import TIQData
-from iqtools.csvdata import CSVData
-from iqtools.wavdata import WAVData
-from iqtools.xdatdata import XDATData
+from iqtools.registry import FORMATS, detect_format, get_iq_class
 
 
 # ------------ TOOLS ----------------------------
-def get_iq_object(filename, header_filename=None):
+def get_iq_object(filename, header_filename=None, **kwargs):
     """
-    Return suitable object accorting to extension.
+    Return suitable object according to the magic bytes at the beginning of the file, or its extension.
+    The reader module is imported only now.
 
     Parameters
     ----------
     filename
+    header_filename Needed for TCAP and XDAT files
+    kwargs Further arguments of the reader, e.g. fs for GNU Radio files
 
     Returns
     -------
-
+    The reader object or None if the format is not known or something is missing
     """
     # Object generation
-    _, file_extension = os.path.splitext(filename)
-
-    iq_data = None
-
-    if file_extension.lower() == '.txt' or file_extension.lower() == '.csv':
-        log.info('This is an ASCII file.')
-        iq_data = CSVData(filename)
-
-    if file_extension.lower() == '.bin':
-        log.info('This is a raw binary file.')
-        iq_data = BINData(filename)
-
-    if file_extension.lower() == '.wav':
-        log.info('This is a wav file.')
-        iq_data = WAVData(filename)
+    name = detect_format(filename)
+    if name is None:
+        log.info('Unknown file format.')
+        return None
 
-    if file_extension.lower() == '.iqt':
-        log.info('This is an iqt file.')
-        iq_data = IQTData(filename)
+    log.info('This is a {} file.'.format(name.upper()))
+    fmt = FORMATS[name]
 
-    if file_extension.lower() == '.iq':
-        log.info('This is an iq file.')
-        iq_data = IQTData(filename)
-
-    if file_extension.lower() == '.tiq':
-        log.info('This is a tiq file.')
-        iq_data = TIQData(filename)
-
-    if file_extension.lower() == '.tdms':
-        log.info('This is a TDMS file.')
-        iq_data = TDMSData(filename)
-
-    if file_extension.lower() == '.dat':
-        log.info('This is a TCAP file.')
-        if not header_filename:
-            log.info('TCAP files need a text header file as well. Aborting....')
-            return None
-        else:
-            iq_data = TCAPData(filename, header_filename)
+    missing = [k for k in fmt['required_kwargs'] if k not in kwargs]
+    if missing:
+        log.info('{} files need {} as well. Aborting....'.format(
+            name.upper(), ', '.join(missing)))
+        return None
 
-    if file_extension.lower() == '.xdat':
-        log.info('This is a XDAT file.')
+    if fmt['needs_header']:
         if not header_filename:
-            log.info('XDAT files need a text header file as well. Aborting....')
+            log.info('{} files need a text header file as well. Aborting....'.format(
+                name.upper()))
             return None
-        else:
-            iq_data = XDATData(filename, header_filename)
+        return get_iq_class(name)(filename, header_filename, **kwargs)
 
-    return iq_data
+    return get_iq_class(name)(filename, **kwargs)
 
 
 def get_eng_notation(value, unit='', decimal_place=2):
@@ -190,6 +155,68 @@ def write_signal_to_bin(cx, filename, fs=1, center=0, write_header=True):
     cx.tofile(filename + '.bin')
 
 
+def write_signal_to_tdms(cx, filename, fs=1, center=0, nsamples_per_record=1024):
+    """
+    Write the signal as a TDMS file in the record layout of the NI RF recordings, which can be read with TDMSData.
+    Every record is one segment with the gain in RecordHeader and the 16 bit I and Q values in RecordData.
+    The gain is chosen such that the largest component fills the 16 bit range. Trailing samples that do
+    not fill a record are dropped.
+    """
+    def tdms_string(text):
+        b = text.encode('utf-8')
+        return struct.pack('<I', len(b)) + b
+
+    def tdms_object(path, raw_index, properties=b'', n_props=0):
+        return tdms_string(path) + raw_index + struct.pack('<I', n_props) + properties
+
+    def double_property(name, value):
+        return tdms_string(name) + struct.pack('<Id', 0x0A, value)
+
+    def int_property(name, value):
+        return tdms_string(name) + struct.pack('<Ii', 0x03, value)
+
+    n_records = len(cx) // nsamples_per_record
+    cx = np.asarray(cx[:n_records * nsamples_per_record])
+    peak = max(np.abs(np.real(cx)).max(initial=0),
+               np.abs(np.imag(cx)).max(initial=0))
+    gain = peak / 32767 if peak else 1.0
+    ii = np.round(np.real(cx) / gain).astype('<i2')
+    qq = np.round(np.imag(cx) / gain).astype('<i2')
+
+    no_data = struct.pack('<I', 0xFFFFFFFF)
+    same_as_before = struct.pack('<I', 0)
+    root_properties = double_property('IQRate', fs) + double_property('RFAttentuation', 0) + \
+        double_property('IQCarrierFrequency', center) + \
+        int_property('NSamplesPerRecord', nsamples_per_record) + \
+        int_property('NRecordsPerFile', n_records)
+
+    with open(filename + '.tdms', 'wb') as f:
+        for i in range(n_records):
+            if i == 0:
+                objects = [tdms_object('/', no_data, root_properties, 5),
+                           tdms_object("/'RecordHeader'", no_data),
+                           tdms_object("/'RecordHeader'/'gain'",
+                                       struct.pack('<IIIQ', 20, 0x0A, 1, 1)),
+                           tdms_object("/'RecordData'", no_data),
+                           tdms_object("/'RecordData'/'I'",
+                                       struct.pack('<IIIQ', 20, 0x02, 1, nsamples_per_record)),
+                           tdms_object("/'RecordData'/'Q'",
+                                       struct.pack('<IIIQ', 20, 0x02, 1, nsamples_per_record))]
+            else:
+                objects = [tdms_object("/'RecordHeader'/'gain'", same_as_before),
+                           tdms_object("/'RecordData'/'I'", same_as_before),
+                           tdms_object("/'RecordData'/'Q'", same_as_before)]
+            meta = struct.pack('<I', len(objects)) + b''.join(objects)
+            raw = struct.pack('<d', gain) + \
+                ii[i * nsamples_per_record:(i + 1) * nsamples_per_record].tobytes() + \
+                qq[i * nsamples_per_record:(i + 1) * nsamples_per_record].tobytes()
+            # ToC: meta data, new object list and raw data
+            f.write(struct.pack('<4sIIQQ', b'TDSm', 0b1110,
+                                4713, len(meta) + len(raw), len(meta)))
+            f.write(meta)
+            f.write(raw)
+
+
 def write_signal_to_csv(filename, cx, fs=1, center=0):
     # insert ascii header which looks like a complex number
     cx = np.insert(cx, 0, complex(fs, center))
@@ -201,12 +228,14 @@ def write_signal_to_csv(filename, cx, fs=1, center=0):
 
 def write_signal_to_wav(filename, cx, fs=1):
     """ Save the singal as an audio wave """
+    from scipy.io import wavfile
     wavfile.write(filename + '.wav', fs,
                   abs(cx) / max(abs(cx)))
 
 
 def make_analytical(x):
     """Make an analytical signal from the real signal"""
+    from scipy.signal import hilbert
 
     yy = hilbert(x)
     ii = np.real(yy)
@@ -302,7 +331,17 @@ def write_timedata_to_npy(iq_obj):
     np.save(iq_obj.filename_wo_ext + '.npy', vars(iq_obj))
 
 
+def write_timedata_to_iqc(iq_obj, nsamples_per_chunk=2 ** 20, raw_int16=False):
+    """
+    Convert the whole file to the IQC cache format, which can be read back with IQCData
+    using memory mapping. Please check write_iqc in iqcdata.
+    """
+    from iqtools.iqcdata import write_iqc
+    return write_iqc(iq_obj, nsamples_per_chunk=nsamples_per_chunk, raw_int16=raw_int16)
+
+
 def write_timedata_to_root(iq_obj):
+    import uproot3
     with uproot3.recreate(iq_obj.filename_wo_ext + '.root') as f:
         f['t_f_samp'] = uproot3.newtree(
             {'f_samp': uproot3.newbranch(np.int32, title='Sampling frequency'),
@@ -328,6 +367,10 @@ def write_spectrum_to_csv(ff, pp, filename, center=0):
 
 
 def write_spectrum_to_root(ff, pp, filename, center=0, title=''):
+    # optional dependencies, only needed for ROOT export
+    import uproot3
+    import uproot3_methods.classes.TH1
+
     class MyTH1(uproot3_methods.classes.TH1.Methods, list):
         def __init__(self, low, high, values, title=""):
             self._fXaxis = types.SimpleNamespace()
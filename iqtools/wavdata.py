@@ -6,11 +6,10 @@ Xaratustrah Aug-2015
 
 """
 
-import numpy as np
 import time
 import os
 from scipy.io import wavfile
-from logging import log
+import logging as log
 from iqtools.iqbase import IQBase
 
 
@@ -20,25 +19,42 @@ class WAVData(IQBase):
 
         # Additional fields in this subclass
         self.date_time = time.ctime(os.path.getctime(self.filename))
+        self.center = 0
+        self.n_channels = 1
+        self.wav_memmap = None
+        self.read_header()
 
     def read(self, nframes=10, lframes=1024, sframes=0):
         self.read_samples(nframes * lframes, offset=sframes * lframes)
 
+    def read_header(self):
+        """
+        Memory map the file once, this reads only the header. Two channels are interpreted as I and Q.
+        """
+        self.fs, self.wav_memmap = wavfile.read(self.filename, mmap=True)
+        self.nsamples_total = self.wav_memmap.shape[0]
+        self.n_channels = 1 if self.wav_memmap.ndim == 1 else self.wav_memmap.shape[1]
+
     def read_samples(self, nsamples, offset=0):
+        """
+        Slice the memory map first and convert only the requested window. Stereo float files of the
+        same precision are viewed as complex values without any copy, left is I and right is Q.
+        """
+        if nsamples > self.nsamples_total - offset:
+            raise ValueError(
+                'Requested number of samples is larger than the available {} samples.'.format(self.nsamples_total))
 
-        # activate memory map
         try:
-            fs, data = wavfile.read(self.filename, mmap=True)
-        except:
+            data = self.wav_memmap[offset:nsamples + offset]
+        except Exception:
             log.error('File seems to end here!')
             return
-        all_data = data.astype(np.complex64)
-        self.fs = fs
-        self.center = 0
-        self.nsamples_total = len(all_data)
 
-        if nsamples > self.nsamples_total - offset:
+        if self.n_channels == 1:
+            self.data_array = data.astype(self.dtype)
+        elif self.n_channels == 2:
+            self.data_array = data.astype(self.real_dtype, copy=False).view(
+                self.dtype)[:, 0]
+        else:
             raise ValueError(
-                'Requested number of samples is larger than the available {} samples.'.format(self.nsamples_total))
-
-        self.data_array = all_data[offset:nsamples + offset]
+                'WAV files with {} channels are not supported.'.format(self.n_channels))
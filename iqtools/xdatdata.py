@@ -16,6 +16,8 @@ import xml.etree.ElementTree as et
 
 
 class XDATData(IQBase):
+    constant_int16_scale = True
+
     def __init__(self, filename, header_filename):
         super().__init__(filename)
 
@@ -23,6 +25,7 @@ class XDATData(IQBase):
         self.center = 0
         self.acq_bw = 0
         self.date_time = ''
+        self.raw_memmap = None
 
         self.header_filename = header_filename
         self.read_header()
@@ -43,38 +46,43 @@ class XDATData(IQBase):
         -------
 
         """
-        filesize = os.path.getsize(self.filename)
-        # each file contains 15625 blocks
-        if not filesize == 4 * self.nsamples_total:
-            raise ValueError(
-                "File size does not match total number of samples. Aborting...")
-
         if nsamples > self.nsamples_total - offset:
             raise ValueError(
                 'Requested number of samples is larger than the available {} samples.'.format(self.nsamples_total))
 
-        total_n_bytes = 8 * nsamples  # 8 comes from 2 times 4 byte integer for I and Q
-        start_n_bytes = 8 * offset
-
-        try:
-            with open(self.filename, 'rb') as f:
-                f.seek(start_n_bytes)
-                ba = f.read(total_n_bytes)
-        except Exception as e:
-            log.error(e + 'File seems to end here!')
-            return
-
-        # return a numpy array of little endian 8 byte floats (known as doubles)
-        # little endian 4 byte ints.
-        self.data_array = np.fromstring(ba, dtype='<i4')
-        # Scale to retrieve value in Volts. Augmented assignment does not work here!
-        self.data_array = self.data_array * self.scale
-        self.data_array = self.data_array.view(
-            dtype='c16')  # reinterpret the bytes as a 16 byte complex number, which consists of 2 doubles.
+        # only the requested slice of the memory map is touched
+        raw = self.get_raw_view(nsamples, offset)
+
+        # Scale to retrieve value in Volts, directly into the complex output array
+        self.data_array = np.empty(nsamples, dtype=self.dtype)
+        np.multiply(raw, self.scale,
+                    out=self.data_array.view(self.real_dtype).reshape(-1, 2))
 
         log.info("Output complex array has a size of {}.".format(
             self.data_array.size))
-        # in order to read you may use: data = x.item()['data'] or data = x[()]['data'] other wise you get 0-d error
+
+    def get_raw_memmap(self):
+        """
+        Memory map the file as pairs of little endian 16 bit integers for I and Q, nothing is read at this point.
+        """
+        if self.raw_memmap is None:
+            filesize = os.path.getsize(self.filename)
+            if not filesize == 4 * self.nsamples_total:
+                raise ValueError(
+                    "File size does not match total number of samples. Aborting...")
+            self.raw_memmap = np.memmap(self.filename, dtype='<i2', mode='r',
+                                        shape=(self.nsamples_total, 2))
+        return self.raw_memmap
+
+    def get_raw_view(self, nsamples, offset=0):
+        """
+        Return a lazy, unscaled view of the raw int16 I and Q values, with shape (nsamples, 2).
+        Multiply with self.scale to get values in Volts.
+        """
+        if nsamples > self.nsamples_total - offset:
+            raise ValueError(
+                'Requested number of samples is larger than the available {} samples.'.format(self.nsamples_total))
+        return self.get_raw_memmap()[offset:offset + nsamples]
 
     def read_header(self):
         """